@@ -7,15 +7,21 @@ Generates 10-minute audio chunks using AudioCraft
 import sys
 import os
 import time
+import json
+import logging
 import subprocess
 import tempfile
+from typing import List
 from buffer_manager import BufferManager
 from config import *
 
+log = logging.getLogger("audio_generator")
+
 class AudioGenerator:
     def __init__(self):
         self.buffer_manager = BufferManager()
         self.generation_script = self._create_generation_script()
+        self.worker = None
     
     def _create_generation_script(self) -> str:
         """Create temporary script for AudioCraft generation"""
@@ -24,6 +30,7 @@ import sys
 sys.path.append("/root/home_projects/audiocraft")
 import torch
 import os
+import json
 import time
 from audiocraft.models import MusicGen
 from audiocraft.data.audio import audio_write
@@ -31,6 +38,37 @@ from audiocraft.data.audio import audio_write
 # Global model instance (load once, reuse for all chunks)
 model = None
 
+def quantize_lm(model, device):
+    """Swap the LM's Linear layers for int8 weight-only versions"""
+    if device != 'cuda':
+        model.lm = torch.ao.quantization.quantize_dynamic(model.lm, {{torch.nn.Linear}}, dtype=torch.qint8)
+        return
+    
+    try:
+        import bitsandbytes as bnb
+    except ImportError:
+        print("bitsandbytes not installed, keeping LM weights in half precision")
+        return
+    
+    def swap(module):
+        for name, child in module.named_children():
+            if isinstance(child, torch.nn.Linear):
+                int8_linear = bnb.nn.Linear8bitLt(
+                    child.in_features, child.out_features,
+                    bias=child.bias is not None, has_fp16_weights=False
+                )
+                int8_linear.weight = bnb.nn.Int8Params(
+                    child.weight.data.cpu(), requires_grad=False, has_fp16_weights=False
+                )
+                if child.bias is not None:
+                    int8_linear.bias = child.bias
+                setattr(module, name, int8_linear.to(device))
+            else:
+                swap(child)
+    
+    swap(model.lm)
+    print(f"LM quantized to int8")
+
 def load_model():
     global model
     if model is None:
@@ -40,10 +78,25 @@ def load_model():
         print(f"Loading model on {{device}}...")
         model = MusicGen.get_pretrained("facebook/musicgen-{MODEL_SIZE}")
         
-        # GPU optimization: use FP16 if available
+        # GPU optimization: BF16 where supported (wider range than FP16, same speed), else FP16
         if device == 'cuda':
-            model = model.to(dtype=torch.float16, device=device)
-            print(f"Model optimized for GPU with FP16")
+            dtype = torch.bfloat16 if torch.cuda.is_bf16_supported() else torch.float16
+            model = model.to(dtype=dtype, device=device)
+            print(f"Model optimized for GPU with {{dtype}}")
+        
+        if {QUANTIZE_LM_INT8}:
+            quantize_lm(model, device)
+        
+        if device == 'cuda':
+            # Compile the LM step (CUDA graphs) to cut per-token dispatch overhead (PyTorch >= 2.1)
+            if hasattr(torch, "compile"):
+                model.lm.forward = torch.compile(model.lm.forward, mode="reduce-overhead", fullgraph=False)
+                
+                # Warm-up so compilation happens before the first real chunk
+                print(f"Compiling LM forward (warm-up generation)...")
+                model.set_generation_params(duration=1)
+                with torch.no_grad():
+                    model.generate(["warmup"], progress=False)
         
         model.set_generation_params(
             use_sampling=True,
@@ -56,37 +109,86 @@ def load_model():
         print(f"Model loaded and ready on {{device}}")
     return model
 
-def generate_chunk(prompt, duration, output_path):
+# Pinned host buffers reused across requests (one per batch slot) and a side copy stream
+host_buffers = {{}}
+copy_stream = None
+
+def to_host(wavs):
+    """Copy generated audio into reused pinned host buffers on a side CUDA stream"""
+    global copy_stream
+    if not torch.cuda.is_available():
+        return [wav.cpu() for wav in wavs]
+    
+    if copy_stream is None:
+        copy_stream = torch.cuda.Stream()
+    copy_stream.wait_stream(torch.cuda.current_stream())
+    
+    host_wavs = []
+    with torch.cuda.stream(copy_stream):
+        for slot, wav in enumerate(wavs):
+            buf = host_buffers.get(slot)
+            if buf is None or buf.shape != wav.shape:
+                buf = torch.empty(wav.shape, dtype=torch.float32, device='cpu', pin_memory=True)
+                host_buffers[slot] = buf
+            buf.copy_(wav, non_blocking=True)
+            host_wavs.append(buf)
+    copy_stream.synchronize()
+    return host_wavs
+
+def generate_batch(prompts, duration, output_paths):
     model = load_model()
     
     # Update duration for this generation
     model.set_generation_params(duration=duration)
     
-    print(f"Generating {{duration}}s audio: {{prompt[:50]}}...")
+    print(f"Generating {{len(prompts)}} x {{duration}}s audio: {{prompts[0][:50]}}...")
     start_time = time.time()
     
-    # Use AudioCraft's built-in progress display
-    with torch.no_grad():
-        wav = model.generate([prompt], progress=True)
+    # One forward pass for the whole batch; fall back to one prompt at a time on OOM
+    try:
+        with torch.no_grad():
+            wavs = list(model.generate(prompts, progress=False))
+    except torch.cuda.OutOfMemoryError:
+        print(f"Out of GPU memory at batch size {{len(prompts)}}, falling back to 1")
+        torch.cuda.empty_cache()
+        wavs = []
+        for prompt in prompts:
+            with torch.no_grad():
+                wavs.append(model.generate([prompt], progress=False)[0])
     
     generation_time = time.time() - start_time
-    print(f"\\nGeneration completed in {{generation_time:.1f}}s ({{duration/generation_time:.2f}}x realtime)")
+    print(f"\\nGeneration completed in {{generation_time:.1f}}s ({{duration*len(prompts)/generation_time:.2f}}x realtime)")
     
-    audio_write(
-        output_path.replace('.wav', ''), 
-        wav[0].cpu(), 
-        model.sample_rate, 
-        strategy="loudness", 
-        loudness_compressor=True
-    )
+    for wav, output_path in zip(to_host(wavs), output_paths):
+        audio_write(
+            output_path.replace('.wav', ''), 
+            wav, 
+            model.sample_rate, 
+            strategy="loudness", 
+            loudness_compressor=True
+        )
     
-    return output_path
+    return output_paths, generation_time
 
 if __name__ == "__main__":
-    prompt = sys.argv[1]
-    duration = int(sys.argv[2])
-    output_path = sys.argv[3]
-    generate_chunk(prompt, duration, output_path)
+    # Persistent worker: one JSON request per stdin line, one JSON reply per stdout line.
+    # Everything else printed by us or AudioCraft goes to stderr so replies stay parseable.
+    replies = sys.stdout
+    sys.stdout = sys.stderr
+    
+    load_model()
+    replies.write(json.dumps({{"ready": True}}) + "\\n")
+    replies.flush()
+    
+    for line in sys.stdin:
+        request = json.loads(line)
+        try:
+            paths, generation_time = generate_batch(request["prompts"], request["duration"], request["output_paths"])
+            reply = {{"ok": True, "paths": paths, "generation_time": generation_time}}
+        except Exception as e:
+            reply = {{"ok": False, "error": str(e)}}
+        replies.write(json.dumps(reply) + "\\n")
+        replies.flush()
 '''
         
         script_path = "/tmp/audiocraft_generator.py"
@@ -94,33 +196,76 @@ if __name__ == "__main__":
             f.write(script_content)
         return script_path
     
+    def _ensure_worker(self) -> bool:
+        """Start (or restart) the persistent AudioCraft worker; the model loads once per worker"""
+        if self.worker and self.worker.poll() is None:
+            return True
+        
+        if self.worker:
+            print(f"Worker exited with code {self.worker.returncode}, restarting...")
+        
+        print("Starting AudioCraft worker...")
+        self.worker = subprocess.Popen(
+            [AUDIOCRAFT_VENV, self.generation_script],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            # Worker progress output is only wanted at INFO or below
+            stderr=None if log.isEnabledFor(logging.INFO) else subprocess.DEVNULL,
+            text=True,
+            bufsize=1,
+            cwd="/root/home_projects/audiocraft"
+        )
+        
+        # Worker replies once the model is loaded
+        ready = self.worker.stdout.readline()
+        if not ready:
+            print("✗ Worker failed to start")
+            self.worker = None
+            return False
+        
+        print("✓ Worker ready")
+        return True
+    
+    def stop_worker(self):
+        """Stop the persistent worker"""
+        if self.worker and self.worker.poll() is None:
+            self.worker.stdin.close()
+            self.worker.wait()
+        self.worker = None
+    
     def generate_chunk(self, prompt: str, output_path: str, duration: int = None) -> bool:
         """Generate single audio chunk"""
+        return self.generate_batch([prompt], [output_path], duration)
+    
+    def generate_batch(self, prompts: List[str], output_paths: List[str], duration: int = None) -> bool:
+        """Generate several audio chunks in one worker request"""
         try:
             chunk_duration = duration or CHUNK_DURATION
-            print(f"\\nGenerating chunk: {os.path.basename(output_path)}")
-            print(f"Prompt: {prompt}")
+            print(f"\\nGenerating {len(output_paths)} chunk(s): {', '.join(os.path.basename(p) for p in output_paths)}")
+            print(f"Prompt: {prompts[0]}")
             print(f"Duration: {chunk_duration} seconds")
             
             start_time = time.time()
             
-            # Run AudioCraft generation in subprocess
-            cmd = [
-                AUDIOCRAFT_VENV,
-                self.generation_script,
-                prompt,
-                str(chunk_duration),
-                output_path
-            ]
+            if not self._ensure_worker():
+                return False
+            
+            request = {"prompts": prompts, "duration": chunk_duration, "output_paths": output_paths}
+            self.worker.stdin.write(json.dumps(request) + "\n")
+            self.worker.stdin.flush()
             
-            result = subprocess.run(cmd, text=True, cwd="/root/home_projects/audiocraft")
+            reply_line = self.worker.stdout.readline()
+            if not reply_line:
+                print(f"✗ Worker died during generation")
+                return False
             
-            if result.returncode == 0:
+            reply = json.loads(reply_line)
+            if reply["ok"]:
                 generation_time = time.time() - start_time
                 print(f"✓ Generation successful in {generation_time:.1f} seconds")
                 return True
             else:
-                print(f"✗ Generation failed with return code {result.returncode}")
+                print(f"✗ Generation failed: {reply['error']}")
                 return False
                 
         except Exception as e:
@@ -133,6 +278,7 @@ if __name__ == "__main__":
         print("Rolling buffer: always generates, deletes oldest when full")
         
         generation_count = 0
+        chunks_generated = 0
         loop_start_time = time.time()
         
         while True:
@@ -156,19 +302,40 @@ if __name__ == "__main__":
                 
                 print(f"Prompt {prompt_index}: {prompt[:60]}...")
                 
-                # Generate chunk
-                temp_path = f"/tmp/chunk_temp_{int(time.time())}.wav"
+                # Reserve a batch of chunks for the current prompt, never past its quota
+                # (so rotation stays exact for any CHUNKS_PER_PROMPT); the worker writes
+                # each one straight into the buffer directory
+                batch_size = max(1, min(GENERATION_BATCH_SIZE, self.buffer_manager.get_prompt_remaining(prompt_index)))
+                reservations = [
+                    self.buffer_manager.reserve_chunk(prompt_index)
+                    for _ in range(batch_size)
+                ]
+                part_paths = [r["part_path"] for r in reservations]
                 
-                if self.generate_chunk(prompt, temp_path):
-                    # Add to buffer (handles rolling deletion automatically)
-                    chunk_info = self.buffer_manager.add_chunk(temp_path, prompt_index)
+                committed = 0
+                try:
+                    success = self.generate_batch([prompt] * len(part_paths), part_paths)
+                    if success:
+                        # Publish into the buffer (handles rolling deletion automatically)
+                        for reservation in reservations:
+                            chunk_info = self.buffer_manager.commit_chunk(reservation["id"])
+                            committed += 1
+                            print(f"✓ Added chunk {chunk_info['id']} to rolling buffer")
+                finally:
+                    # Anything not published (failed batch, or a commit that raised) goes
+                    # away with its part file instead of leaking the reservation
+                    for reservation in reservations[committed:]:
+                        self.buffer_manager.discard_chunk(reservation["id"])
+                
+                if success:
+                    self.buffer_manager.flush_metadata()
                     
                     # Calculate running stats
+                    chunks_generated += len(reservations)
                     elapsed = time.time() - loop_start_time
-                    avg_time = elapsed / generation_count
+                    avg_time = elapsed / chunks_generated
                     
-                    print(f"✓ Added chunk {chunk_info['id']} to rolling buffer")
-                    print(f"Stats: {generation_count} chunks in {elapsed/3600:.1f}h (avg: {avg_time/60:.1f} min/chunk)")
+                    print(f"Stats: {chunks_generated} chunks in {elapsed/3600:.1f}h (avg: {avg_time/60:.1f} min/chunk)")
                 else:
                     print("✗ Failed to generate chunk, retrying...")
                     continue
@@ -185,7 +352,11 @@ if __name__ == "__main__":
             except Exception as e:
                 print(f"Generation loop error: {e}")
                 time.sleep(30)  # Wait before retrying
+        
+        self.stop_worker()
+        self.buffer_manager.wait_durable()
 
 if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(message)s")
     generator = AudioGenerator()
     generator.run_generation_loop()
\ No newline at end of file
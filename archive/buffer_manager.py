@@ -5,61 +5,188 @@ Maintains exactly 1,440 files (1 week of audio) with rolling deletion
 """
 
 import os
-import glob
+import re
 import json
+import struct
 import time
 import fcntl
+import heapq
+import bisect
+import hashlib
+import shutil
+import contextlib
+import queue
+import logging
+import threading
+from collections import Counter
+from itertools import islice
 from typing import List, Dict, Optional
 from config import *
 
+# orjson serializes the metadata snapshot in C; stdlib json is the fallback
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+log = logging.getLogger("buffer_manager")
+
+def _json_dumps(obj) -> bytes:
+    """Compact JSON as bytes"""
+    if orjson:
+        return orjson.dumps(obj)
+    return json.dumps(obj, separators=(',', ':')).encode()
+
+def _json_loads(data: bytes):
+    """Parse JSON bytes (decode errors are ValueError either way)"""
+    return orjson.loads(data) if orjson else json.loads(data)
+
+# chunk_001_prompt_0_60s.wav -> (chunk id, prompt index, duration)
+CHUNK_FILENAME_RE = re.compile(r'^chunk_(\d+)_prompt_(\d+)_(\d+)s\.wav$')
+
+def prompt_hash(prompt: str) -> str:
+    """Short stable fingerprint of a prompt, stored per chunk to detect PROMPTS edits"""
+    return hashlib.blake2b(prompt.encode(), digest_size=8).hexdigest()
+
+def build_health_table() -> tuple:
+    """Buffer health by unconsumed hours as (thresholds, healths), ascending; below the
+    first threshold the buffer is DEPLETED. Looked up with a single bisect."""
+    table = sorted([
+        (EMERGENCY_BUFFER_HOURS, "EMERGENCY"),
+        (CRITICAL_BUFFER_HOURS, "CRITICAL"),
+        (WARNING_BUFFER_HOURS, "WARNING"),
+        (TARGET_BUFFER_HOURS, "HEALTHY"),
+    ])
+    if [health for _, health in table] != ["EMERGENCY", "CRITICAL", "WARNING", "HEALTHY"]:
+        raise ValueError("buffer hour thresholds in config.py are out of order")
+    return [threshold for threshold, _ in table], [health for _, health in table]
+
+# Fold the operations log into a fresh snapshot once it grows past this many records
+OPLOG_SNAPSHOT_LINES = 1000
+
+# A chunk that exists but fails to read this many times is moved aside and dropped
+MAX_READ_FAILURES = 3
+
+# Part files untouched for this long belong to a crashed generator, not one still writing
+STALE_PART_SECONDS = 3600
+
+# The lock file's first bytes hold the log state every process shares: the last sequence
+# number appended to the operations log and the log generation (bumped on each truncation)
+LOG_HEADER = struct.Struct('<QQ')
+
 class BufferManager:
     def __init__(self):
         self.buffer_dir = BUFFER_DIR
         os.makedirs(self.buffer_dir, exist_ok=True)
         self.metadata_file = os.path.join(self.buffer_dir, "buffer_metadata.json")
-        self.load_or_create_metadata()
-        self.enforce_buffer_limit()
+        
+        # Lock file is opened once and kept for the manager's lifetime (never unlinked)
+        self._lock_fd = os.open(self.metadata_file + ".lock", os.O_CREAT | os.O_RDWR, 0o644)
+        # flock is held by the open file description, which every thread shares, so threads
+        # exclude each other with this RLock and only the outermost holder takes the flock
+        self._thread_lock = threading.RLock()
+        self._lock_depth = 0
+        self._lock_exclusive = False
+        
+        # Memoized get_buffer_status result, recomputed only after a mutation
+        self._cached_status = None
+        self._status_dirty = True
+        # Health thresholds from config, built on the first get_buffer_status() call
+        self._health_table = None
+        
+        # Mutators append to the operations log; full snapshots are written by
+        # flush_metadata() only when required or when the log grows too long
+        self.oplog_file = self.metadata_file + ".log"
+        self._oplog = open(self.oplog_file, 'ab', buffering=0)
+        self._oplog_lines = 0
+        self._log_pending = False
+        self._replaying = False
+        self._save_pending = False
+        # How far this process has applied the log: byte offset and log generation.
+        # Generator and feeder share the log, so each catches up on the other's records
+        # whenever it takes the lock (metadata is loaded there on first use)
+        self._log_pos = 0
+        self._log_gen = None
+        self.metadata = None
+        
+        # Chunk ids handed out by reserve_chunk() but not yet committed
+        self._reserved = {}
+        
+        # Failed reads per chunk id, reported by the stream through verify_chunk()
+        self._read_failures = Counter()
+        
+        # Committed chunk files are fsynced in the background so the generator
+        # can start the next batch while the data reaches disk
+        self._fsync_q = queue.Queue()
+        threading.Thread(target=self._fsync_worker, daemon=True).start()
+        
+        with self._metadata_lock():
+            self.sweep_stale_parts()
+            self.enforce_buffer_limit()
+            self.flush_metadata()
+    
+    def sweep_stale_parts(self):
+        """Remove .part_ files left behind by a generator that died before committing them"""
+        cutoff = time.time() - STALE_PART_SECONDS
+        with os.scandir(self.buffer_dir) as it:
+            stale = [entry for entry in it if entry.name.startswith(".part_") and entry.stat().st_mtime < cutoff]
+        for entry in stale:
+            try:
+                os.remove(entry.path)
+                log.info("Removed stale part file: %s", entry.name)
+            except FileNotFoundError:
+                pass
     
     def load_or_create_metadata(self):
         """Load existing metadata or create from files on disk with locking"""
         if os.path.exists(self.metadata_file):
             try:
-                with open(self.metadata_file, 'r') as f:
+                with open(self.metadata_file, 'rb') as f:
                     fcntl.flock(f.fileno(), fcntl.LOCK_SH)
-                    self.metadata = json.load(f)
+                    self.metadata = _json_loads(f.read())
                     fcntl.flock(f.fileno(), fcntl.LOCK_UN)
-                print(f"Loaded metadata with {len(self.metadata['chunks'])} chunks")
+                self._build_indexes()
+                self._oplog_lines = 0
+                self._replay_oplog()
+                log.info("Loaded metadata with %d chunks", len(self._chunks_by_id))
             except Exception as e:
-                print(f"Error loading metadata: {e}, rebuilding from files...")
+                log.error("Error loading metadata: %s, rebuilding from files...", e)
                 self.rebuild_metadata_from_files()
         else:
-            print("No metadata found, scanning files...")
+            log.info("No metadata found, scanning files...")
             self.rebuild_metadata_from_files()
     
     def rebuild_metadata_from_files(self):
         """Rebuild metadata by scanning audio_buffer directory with prompt validation"""
-        print("Rebuilding metadata from files...")
+        log.info("Rebuilding metadata from files...")
         
-        # Find all WAV files
-        wav_files = glob.glob(os.path.join(self.buffer_dir, "chunk_*.wav"))
-        wav_files.sort()  # Sort by filename
+        # Find all WAV files (single readdir pass; DirEntry caches the stat result)
+        with os.scandir(self.buffer_dir) as it:
+            wav_files = [entry for entry in it if entry.name.startswith("chunk_") and entry.name.endswith(".wav")]
+        wav_files.sort(key=lambda entry: entry.name)  # Sort by filename
         
         self.metadata = {
             "chunks": [],
             "next_chunk_id": 1,
-            "current_prompt_index": 0
+            "current_prompt_index": 0,
+            # The scan supersedes everything logged so far
+            "oplog_seq": self._read_log_header()[0]
         }
+        self._log_pos = os.fstat(self._oplog.fileno()).st_size
         
         prompt_mismatches = []
         
-        for i, file_path in enumerate(wav_files):
-            filename = os.path.basename(file_path)
+        for i, entry in enumerate(wav_files):
+            filename = entry.name
             
             # Parse filename: chunk_001_prompt_0_60s.wav
+            match = CHUNK_FILENAME_RE.match(filename)
+            if not match:
+                log.warning("Could not parse filename %s", filename)
+                continue
+            
             try:
-                parts = filename.replace('.wav', '').split('_')
-                chunk_id = int(parts[1])
-                file_prompt_index = int(parts[3])
+                chunk_id, file_prompt_index, _ = map(int, match.groups())
                 
                 # Calculate expected prompt based on position
                 expected_prompt_index = ((i) // CHUNKS_PER_PROMPT) % len(PROMPTS)
@@ -72,16 +199,16 @@ class BufferManager:
                         "file_prompt": file_prompt_index,
                         "expected_prompt": expected_prompt_index
                     })
-                    print(f"WARNING: Prompt mismatch in {filename}: has {file_prompt_index}, expected {expected_prompt_index}")
+                    log.warning("Prompt mismatch in %s: has %d, expected %d", filename, file_prompt_index, expected_prompt_index)
                 
                 chunk_info = {
                     "id": chunk_id,
                     "filename": filename,
-                    "path": file_path,
+                    "path": entry.path,
                     "prompt_index": file_prompt_index,  # Use file's prompt, not calculated
-                    "prompt": PROMPTS[file_prompt_index] if file_prompt_index < len(PROMPTS) else "unknown",
+                    "prompt_hash": prompt_hash(PROMPTS[file_prompt_index]) if file_prompt_index < len(PROMPTS) else None,
                     "duration": CHUNK_DURATION,
-                    "created_at": os.path.getctime(file_path),
+                    "created_at": entry.stat(follow_symlinks=False).st_ctime,
                     "consumed": False
                 }
                 
@@ -91,223 +218,509 @@ class BufferManager:
                 if chunk_id >= self.metadata["next_chunk_id"]:
                     self.metadata["next_chunk_id"] = chunk_id + 1
                     
-            except (ValueError, IndexError) as e:
-                print(f"Warning: Could not parse filename {filename}: {e}")
+            except OSError as e:
+                log.warning("Could not stat %s: %s", filename, e)
                 continue
         
         # Sort chunks by ID
         self.metadata["chunks"].sort(key=lambda x: x["id"])
+        self._build_indexes()
         
         if prompt_mismatches:
-            print(f"\n⚠️  PROMPT ALIGNMENT ISSUES DETECTED ({len(prompt_mismatches)} files)")
-            print("This may cause missing 3-second breaks between prompts.")
-            print("Consider manual repair or regeneration of affected segments.")
+            log.warning("⚠️  PROMPT ALIGNMENT ISSUES DETECTED (%d files)", len(prompt_mismatches))
+            log.warning("This may cause missing 3-second breaks between prompts.")
+            log.warning("Consider manual repair or regeneration of affected segments.")
+        
+        log.info("Rebuilt metadata with %d chunks", len(self._chunks_by_id))
+        self._save_pending = True
+    
+    def _build_indexes(self):
+        """Move the chunk list into id/prompt/creation-time indices"""
+        chunks = self.metadata.pop("chunks", [])
+        
+        # Chunks keyed by id. Invariant: dict order is id order, which is also creation
+        # order (ids only ever grow), so the first entries are always the oldest chunks.
+        chunks.sort(key=lambda c: c["id"])
+        self._chunks_by_id = {c["id"]: c for c in chunks}
+        
+        # Min-heap of unconsumed ids; consumed/removed entries are skipped lazily
+        self._unconsumed_ids = [c["id"] for c in chunks if not c["consumed"]]
+        heapq.heapify(self._unconsumed_ids)
+        self._unconsumed_count = len(self._unconsumed_ids)
         
-        print(f"Rebuilt metadata with {len(self.metadata['chunks'])} chunks")
-        self.save_metadata()
+        self._prompt_counts = Counter(c["prompt_index"] for c in chunks)
+        self._status_dirty = True
+        
+        # Chunks generated before PROMPTS was edited no longer match their prompt_index
+        current_hashes = [prompt_hash(p) for p in PROMPTS]
+        drifted = sum(
+            1 for c in chunks
+            if c.get("prompt_hash") and (c["prompt_index"] >= len(PROMPTS) or c["prompt_hash"] != current_hashes[c["prompt_index"]])
+        )
+        if drifted:
+            log.warning("⚠️  %d chunks were generated with prompts that no longer match config.PROMPTS", drifted)
+    
+    def _index_chunk(self, chunk_info: Dict):
+        """Add a chunk to the in-memory indices"""
+        chunk_id = chunk_info["id"]
+        assert not self._chunks_by_id or chunk_id > next(reversed(self._chunks_by_id)), \
+            f"chunk {chunk_id} would break id/creation ordering"
+        self._chunks_by_id[chunk_id] = chunk_info
+        if not chunk_info["consumed"]:
+            heapq.heappush(self._unconsumed_ids, chunk_id)
+            self._unconsumed_count += 1
+        self._prompt_counts[chunk_info["prompt_index"]] += 1
+        if chunk_id >= self.metadata["next_chunk_id"]:
+            self.metadata["next_chunk_id"] = chunk_id + 1
+        self._status_dirty = True
+        self._log_op("add", chunk=chunk_info)
+    
+    def _consume_chunk(self, chunk_info: Dict):
+        """Flag a chunk as consumed in the in-memory indices"""
+        if chunk_info["consumed"]:
+            return
+        chunk_info["consumed"] = True
+        self._unconsumed_count -= 1
+        self._status_dirty = True
+        self._log_op("consume", id=chunk_info["id"])
+    
+    def _remove_chunk(self, chunk_info: Dict):
+        """Drop a chunk from the in-memory indices"""
+        del self._chunks_by_id[chunk_info["id"]]
+        self._prompt_counts[chunk_info["prompt_index"]] -= 1
+        if not chunk_info["consumed"]:
+            self._unconsumed_count -= 1
+        self._status_dirty = True
+        self._log_op("delete", id=chunk_info["id"])
+    
+    def _log_op(self, op: str, **fields):
+        """Append one mutation to the operations log (fsynced by flush_metadata)"""
+        if self._replaying:
+            return
+        # Called under the exclusive lock, so this process has applied the whole log and
+        # the shared sequence number cannot move underneath it
+        last_seq, gen = self._read_log_header()
+        seq = max(last_seq, self.metadata.get("oplog_seq", 0)) + 1
+        data = _json_dumps(dict(fields, op=op, seq=seq)) + b"\n"
+        
+        # Anything past what replay could parse is a torn record from a crashed writer
+        if os.fstat(self._oplog.fileno()).st_size != self._log_pos:
+            os.ftruncate(self._oplog.fileno(), self._log_pos)
+        self._oplog.write(data)
+        self._log_pos += len(data)
+        self.metadata["oplog_seq"] = seq
+        self._write_log_header(seq, gen)
+        self._oplog_lines += 1
+        self._log_pending = True
+    
+    def _read_log_header(self) -> tuple:
+        """(last logged sequence number, log generation) from the lock file"""
+        data = os.pread(self._lock_fd, LOG_HEADER.size, 0)
+        return LOG_HEADER.unpack(data) if len(data) == LOG_HEADER.size else (0, 0)
+    
+    def _write_log_header(self, seq: int, gen: int):
+        """Publish the log state to the other processes (exclusive lock held)"""
+        os.pwrite(self._lock_fd, LOG_HEADER.pack(seq, gen), 0)
+    
+    def _sync_log(self):
+        """Bring this process up to date with the shared snapshot and log (lock held)"""
+        gen = self._read_log_header()[1]
+        if gen != self._log_gen:
+            # First use, or another process snapshotted and truncated the log
+            self.load_or_create_metadata()
+            self._log_gen = gen
+            # Ids reserved before the reload are still being generated; never hand them out twice
+            if self._reserved:
+                self.metadata["next_chunk_id"] = max(self.metadata["next_chunk_id"], max(self._reserved) + 1)
+        elif os.fstat(self._oplog.fileno()).st_size > self._log_pos:
+            # Records appended by the other process since we last looked
+            self._replay_oplog(self._log_pos)
+    
+    def _replay_oplog(self, start: int = 0):
+        """Apply operations logged since the last snapshot (from byte offset start)"""
+        self._log_pos = start
+        if not os.path.exists(self.oplog_file):
+            return
+        
+        # Records at or below the applied sequence number are already in memory: a crash
+        # between the snapshot replace and the log truncate leaves such records behind
+        snapshot_seq = self.metadata.get("oplog_seq", 0)
+        snapshot_next_id = self.metadata["next_chunk_id"]
+        skipped = 0
+        replayed = 0
+        
+        self._replaying = True
+        try:
+            with open(self.oplog_file, 'rb') as f:
+                f.seek(start)
+                for line in f:
+                    if not line.endswith(b"\n"):
+                        break  # torn final record from an interrupted write
+                    try:
+                        record = _json_loads(line)
+                    except ValueError:
+                        break
+                    self._log_pos += len(line)
+                    self._oplog_lines += 1
+                    replayed += 1
+                    
+                    seq = record.get("seq")
+                    if seq is not None:
+                        if seq <= snapshot_seq:
+                            skipped += 1
+                            continue
+                        self.metadata["oplog_seq"] = seq
+                    elif record["op"] == "add" and record["chunk"]["id"] < snapshot_next_id:
+                        skipped += 1
+                        continue  # unsequenced record from an older log: already snapshotted or purged
+                    
+                    op = record["op"]
+                    if op == "add":
+                        if record["chunk"]["id"] not in self._chunks_by_id:
+                            self._index_chunk(record["chunk"])
+                    elif op == "consume":
+                        chunk = self._chunks_by_id.get(record["id"])
+                        if chunk:
+                            self._consume_chunk(chunk)
+                    elif op == "delete":
+                        chunk = self._chunks_by_id.get(record["id"])
+                        if chunk:
+                            self._remove_chunk(chunk)
+                    elif op == "rotate":
+                        self.metadata["current_prompt_index"] = record["prompt_index"]
+        finally:
+            self._replaying = False
+        
+        if start == 0 and replayed:
+            log.info("Replayed %d logged operations (%d already in snapshot)", replayed - skipped, skipped)
     
     def enforce_buffer_limit(self):
         """Ensure buffer has exactly MAX_BUFFER_FILES or fewer"""
-        current_count = len(self.metadata["chunks"])
+        current_count = len(self._chunks_by_id)
         
         if current_count > MAX_BUFFER_FILES:
-            print(f"Buffer has {current_count} files, trimming to {MAX_BUFFER_FILES}")
-            
-            # Sort by creation time, delete oldest
-            self.metadata["chunks"].sort(key=lambda x: x["created_at"])
+            log.info("Buffer has %d files, trimming to %d", current_count, MAX_BUFFER_FILES)
             
+            # Chunks are held oldest-first, so the excess is simply the head
             files_to_delete = current_count - MAX_BUFFER_FILES
-            for i in range(files_to_delete):
-                chunk_to_delete = self.metadata["chunks"][i]
+            for chunk_to_delete in list(islice(self._chunks_by_id.values(), files_to_delete)):
                 self.delete_chunk_file(chunk_to_delete)
             
-            # Keep only the newest MAX_BUFFER_FILES
-            self.metadata["chunks"] = self.metadata["chunks"][files_to_delete:]
-            self.save_metadata()
-            
-            print(f"Trimmed buffer to {len(self.metadata['chunks'])} files")
+            log.info("Trimmed buffer to %d files", len(self._chunks_by_id))
     
     def delete_chunk_file(self, chunk_info: Dict):
-        """Delete a chunk file from disk"""
+        """Delete a chunk file from disk and drop it from the indices"""
         try:
-            if os.path.exists(chunk_info["path"]):
-                os.remove(chunk_info["path"])
-                print(f"Deleted old file: {chunk_info['filename']}")
+            os.remove(chunk_info["path"])
+            log.debug("Deleted old file: %s", chunk_info["filename"])
+        except FileNotFoundError:
+            pass
         except Exception as e:
-            print(f"Error deleting file {chunk_info['filename']}: {e}")
+            log.error("Error deleting file %s: %s", chunk_info["filename"], e)
+        self._remove_chunk(chunk_info)
     
-    def add_chunk(self, chunk_path: str, prompt_index: int) -> Dict:
-        """Add new chunk to buffer with atomic write, defer deletion"""
+    def verify_chunk(self, chunk_info: Dict) -> bool:
+        """Check a chunk the stream could not read; drop it if the file is gone or keeps failing"""
         with self._metadata_lock():
-            chunk_id = self.metadata["next_chunk_id"]
-            filename = f"chunk_{chunk_id:03d}_prompt_{prompt_index}_{CHUNK_DURATION}s.wav"
-            final_path = os.path.join(self.buffer_dir, filename)
-            temp_path = os.path.join(self.buffer_dir, f".tmp_{filename}")
+            if os.path.exists(chunk_info["path"]):
+                self._read_failures[chunk_info["id"]] += 1
+                if self._read_failures[chunk_info["id"]] < MAX_READ_FAILURES:
+                    return True
+                
+                # Exists but cannot be parsed: keep it for inspection, out of the buffer
+                quarantine_dir = os.path.join(self.buffer_dir, "quarantine")
+                os.makedirs(quarantine_dir, exist_ok=True)
+                log.warning("Chunk unreadable after %d attempts, quarantining: %s", MAX_READ_FAILURES, chunk_info["filename"])
+                try:
+                    os.replace(chunk_info["path"], os.path.join(quarantine_dir, chunk_info["filename"]))
+                except OSError as e:
+                    log.error("Could not quarantine %s: %s", chunk_info["filename"], e)
+            else:
+                log.warning("Chunk file missing, dropping: %s", chunk_info["filename"])
             
-            # Atomic write: temp -> fsync -> rename
-            if chunk_path != temp_path:
-                os.rename(chunk_path, temp_path)
+            self._read_failures.pop(chunk_info["id"], None)
+            # The caller's dict may predate a reload from another process's snapshot
+            indexed = self._chunks_by_id.get(chunk_info["id"])
+            if indexed:
+                self._remove_chunk(indexed)
+            return False
+    
+    def reserve_chunk(self, prompt_index: int) -> Dict:
+        """Reserve the next chunk id; the generator writes the audio straight to part_path"""
+        with self._metadata_lock():
+            chunk_id = self.metadata["next_chunk_id"]
+            self.metadata["next_chunk_id"] += 1
             
-            # Fsync to ensure data is written
-            with open(temp_path, 'r+b') as f:
-                f.flush()
-                os.fsync(f.fileno())
+            filename = f"chunk_{chunk_id:03d}_prompt_{prompt_index}_{CHUNK_DURATION}s.wav"
+            reservation = {
+                "id": chunk_id,
+                "prompt_index": prompt_index,
+                "filename": filename,
+                "final_path": os.path.join(self.buffer_dir, filename),
+                # Keeps the .wav suffix so audio_write (which appends .wav to the stem) lands here
+                "part_path": os.path.join(self.buffer_dir, f".part_{filename}")
+            }
+            self._reserved[chunk_id] = reservation
+            return reservation
+    
+    def commit_chunk(self, chunk_id: int) -> Dict:
+        """Publish a reserved chunk once its part file is fully written"""
+        with self._metadata_lock():
+            reservation = self._reserved[chunk_id]
             
-            # Atomic rename to final location
-            os.rename(temp_path, final_path)
+            # Atomically move into place; durability is handled by the fsync thread.
+            # The reservation is only released once this succeeds, so discard_chunk()
+            # can still clean up after a failed commit
+            os.replace(reservation["part_path"], reservation["final_path"])
+            del self._reserved[chunk_id]
             
             # Add new chunk to metadata
             chunk_info = {
                 "id": chunk_id,
-                "filename": filename,
-                "path": final_path,
-                "prompt_index": prompt_index,
-                "prompt": PROMPTS[prompt_index],
+                "filename": reservation["filename"],
+                "path": reservation["final_path"],
+                "prompt_index": reservation["prompt_index"],
+                "prompt_hash": prompt_hash(PROMPTS[reservation["prompt_index"]]),
                 "duration": CHUNK_DURATION,
                 "created_at": time.time(),
                 "consumed": False
             }
             
-            self.metadata["chunks"].append(chunk_info)
-            self.metadata["next_chunk_id"] += 1
+            self._index_chunk(chunk_info)
+            self._fsync_q.put(chunk_info)
             
             # Purge old consumed files if over limit (deferred deletion)
             self.purge_consumed_files()
             
-            self.save_metadata()
-            
-            print(f"Added chunk {chunk_id}, buffer size: {len(self.metadata['chunks'])}")
+            log.debug("Added chunk %d, buffer size: %d", chunk_id, len(self._chunks_by_id))
             return chunk_info
     
+    def _fsync_worker(self):
+        """Background thread: fsync committed chunk files and their directory entries"""
+        while True:
+            # Drain whatever is queued so one directory fsync covers the whole batch
+            batch = [self._fsync_q.get()]
+            while True:
+                try:
+                    batch.append(self._fsync_q.get_nowait())
+                except queue.Empty:
+                    break
+            
+            try:
+                synced = False
+                for chunk_info in batch:
+                    try:
+                        fd = os.open(chunk_info["path"], os.O_RDONLY)
+                        try:
+                            os.fsync(fd)
+                        finally:
+                            os.close(fd)
+                        synced = True
+                    except FileNotFoundError:
+                        pass  # purged before it was synced
+                    except Exception as e:
+                        log.error("Error syncing %s: %s", chunk_info["filename"], e)
+                
+                # The rename into place is only persistent once the directory entry is synced
+                if synced:
+                    try:
+                        dir_fd = os.open(self.buffer_dir, os.O_RDONLY | os.O_DIRECTORY)
+                        try:
+                            os.fsync(dir_fd)
+                        finally:
+                            os.close(dir_fd)
+                    except Exception as e:
+                        log.error("Error syncing %s: %s", self.buffer_dir, e)
+            finally:
+                for _ in batch:
+                    self._fsync_q.task_done()
+    
+    def wait_durable(self):
+        """Block until every committed chunk has been fsynced"""
+        self._fsync_q.join()
+    
+    def discard_chunk(self, chunk_id: int):
+        """Drop a reservation whose generation failed, removing any partial file"""
+        with self._metadata_lock():
+            reservation = self._reserved.pop(chunk_id, None)
+            if reservation:
+                try:
+                    os.remove(reservation["part_path"])
+                except FileNotFoundError:
+                    pass
+    
+    def add_chunk(self, chunk_path: str, prompt_index: int) -> Dict:
+        """Add an already-written chunk file to the buffer"""
+        reservation = self.reserve_chunk(prompt_index)
+        # Plain rename when chunk_path is on the buffer's filesystem; otherwise copy into
+        # the part file first so the publish in commit_chunk is still an atomic rename
+        try:
+            shutil.move(chunk_path, reservation["part_path"])
+            return self.commit_chunk(reservation["id"])
+        except Exception:
+            self.discard_chunk(reservation["id"])
+            raise
+    
     def get_next_chunk(self) -> Optional[Dict]:
         """Get next unconsumed chunk for streaming with locking"""
+        # Exclusive: stale heap entries are popped here
         with self._metadata_lock():
-            # Sort by ID to ensure proper order
-            available_chunks = [c for c in self.metadata["chunks"] if not c["consumed"] and os.path.exists(c["path"])]
-            available_chunks.sort(key=lambda x: x["id"])
+            while self._unconsumed_ids:
+                chunk = self._chunks_by_id.get(self._unconsumed_ids[0])
+                
+                # Skip ids that were consumed or purged since they were pushed
+                if chunk is None or chunk["consumed"]:
+                    heapq.heappop(self._unconsumed_ids)
+                    continue
+                
+                # Files are only created/deleted here, so trust the index; the
+                # stream calls verify_chunk() if it fails to open the file
+                return chunk
             
-            return available_chunks[0] if available_chunks else None
+            return None
     
     def mark_chunk_consumed(self, chunk_id: int):
         """Mark chunk as consumed and trigger purge"""
         with self._metadata_lock():
-            for chunk in self.metadata["chunks"]:
-                if chunk["id"] == chunk_id:
-                    chunk["consumed"] = True
-                    break
+            chunk = self._chunks_by_id.get(chunk_id)
+            if chunk:
+                self._consume_chunk(chunk)
             
             # Trigger purge after marking consumed
             self.purge_consumed_files()
-            self.save_metadata()
     
     def get_buffer_status(self) -> Dict:
         """Get current buffer status based on UNCONSUMED count"""
+        # Exclusive: the memoized status and health table are written here
         with self._metadata_lock():
-            available_chunks = [c for c in self.metadata["chunks"] if not c["consumed"] and os.path.exists(c["path"])]
-            unconsumed_count = len(available_chunks)
+            if not self._status_dirty:
+                return dict(self._cached_status)
+            
+            unconsumed_count = self._unconsumed_count
             
             # Calculate hours remaining (60 chunks = 1 hour)
             hours_remaining = unconsumed_count / 60
             
             # Determine buffer health based on UNCONSUMED hours
-            if hours_remaining >= TARGET_BUFFER_HOURS:
-                health = "HEALTHY"
-            elif hours_remaining >= WARNING_BUFFER_HOURS:
-                health = "WARNING"
-            elif hours_remaining >= CRITICAL_BUFFER_HOURS:
-                health = "CRITICAL"
-            elif hours_remaining >= EMERGENCY_BUFFER_HOURS:
-                health = "EMERGENCY"
-            else:
-                health = "DEPLETED"
+            if self._health_table is None:
+                self._health_table = build_health_table()
+            thresholds, healths = self._health_table
+            level = bisect.bisect_right(thresholds, hours_remaining) - 1
+            health = healths[level] if level >= 0 else "DEPLETED"
             
-            return {
-                "total_files": len(self.metadata["chunks"]),
+            self._cached_status = {
+                "total_files": len(self._chunks_by_id),
                 "available_chunks": unconsumed_count,
                 "hours_remaining": hours_remaining,
                 "health": health,
                 "cooldown_seconds": COOLDOWN_TIMINGS.get(health, 0),
                 "next_prompt_index": self.metadata["current_prompt_index"],
-                "buffer_full": len(self.metadata["chunks"]) >= MAX_BUFFER_FILES
+                "buffer_full": len(self._chunks_by_id) >= MAX_BUFFER_FILES
             }
+            self._status_dirty = False
+            return dict(self._cached_status)
     
     def get_next_prompt_index(self) -> int:
         """Get next prompt index for generation with locking"""
         with self._metadata_lock():
             # Count chunks for current prompt
             current_prompt = self.metadata["current_prompt_index"]
-            current_prompt_chunks = [c for c in self.metadata["chunks"] 
-                                   if c["prompt_index"] == current_prompt]
             
             # If we have enough chunks for this prompt, move to next
-            if len(current_prompt_chunks) >= CHUNKS_PER_PROMPT:
+            if self._prompt_counts[current_prompt] >= CHUNKS_PER_PROMPT:
                 self.metadata["current_prompt_index"] = (current_prompt + 1) % len(PROMPTS)
-                self.save_metadata()
+                self._status_dirty = True
+                self._log_op("rotate", prompt_index=self.metadata["current_prompt_index"])
             
             return self.metadata["current_prompt_index"]
     
+    def get_prompt_remaining(self, prompt_index: int) -> int:
+        """Chunks still to generate for a prompt before get_next_prompt_index() rotates"""
+        with self._metadata_lock(exclusive=False):
+            return max(CHUNKS_PER_PROMPT - self._prompt_counts[prompt_index], 0)
+    
     def save_metadata(self):
-        """Save buffer metadata to file with locking"""
+        """Save a full metadata snapshot atomically and truncate the operations log"""
         try:
-            with open(self.metadata_file, 'w') as f:
-                fcntl.flock(f.fileno(), fcntl.LOCK_EX)
-                json.dump(self.metadata, f, indent=2)
+            # Chunks live in the id index; serialize them back to a list only here
+            snapshot = dict(self.metadata, chunks=list(self._chunks_by_id.values()))
+            temp_file = self.metadata_file + ".tmp"
+            with open(temp_file, 'wb') as f:
+                f.write(_json_dumps(snapshot))
                 f.flush()
                 os.fsync(f.fileno())
-                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+            os.replace(temp_file, self.metadata_file)
+            
+            # Under the exclusive lock this process has applied every logged record, so the
+            # snapshot covers the whole log. The generation is bumped before truncating so
+            # other processes reload the snapshot rather than read past the end of the log
+            seq, gen = self._read_log_header()
+            self._write_log_header(max(seq, self.metadata.get("oplog_seq", 0)), gen + 1)
+            self._log_gen = gen + 1
+            os.ftruncate(self._oplog.fileno(), 0)
+            self._log_pos = 0
+            self._oplog_lines = 0
+            self._log_pending = False
+            self._save_pending = False
         except Exception as e:
-            print(f"Error saving metadata: {e}")
+            log.error("Error saving metadata: %s", e)
+    
+    def flush_metadata(self):
+        """Persist pending mutations (call once per loop)"""
+        if not (self._save_pending or self._log_pending):
+            return
+        
+        with self._metadata_lock():
+            if self._save_pending or self._oplog_lines >= OPLOG_SNAPSHOT_LINES:
+                self.save_metadata()
+            else:
+                os.fsync(self._oplog.fileno())
+                self._log_pending = False
     
     def get_file_count(self) -> int:
         """Get current number of files in buffer"""
-        return len(self.metadata["chunks"])
-    
-    def _metadata_lock(self):
-        """Context manager for metadata file locking"""
-        class MetadataLock:
-            def __init__(self, metadata_file):
-                self.metadata_file = metadata_file
-                self.lock_file = metadata_file + ".lock"
-                self.lock_fd = None
-            
-            def __enter__(self):
-                self.lock_fd = open(self.lock_file, 'w')
-                fcntl.flock(self.lock_fd.fileno(), fcntl.LOCK_EX)
-                return self
-            
-            def __exit__(self, exc_type, exc_val, exc_tb):
-                if self.lock_fd:
-                    fcntl.flock(self.lock_fd.fileno(), fcntl.LOCK_UN)
-                    self.lock_fd.close()
-                    try:
-                        os.remove(self.lock_file)
-                    except:
-                        pass
-        
-        return MetadataLock(self.metadata_file)
+        with self._metadata_lock(exclusive=False):
+            return len(self._chunks_by_id)
+    
+    @contextlib.contextmanager
+    def _metadata_lock(self, exclusive: bool = True):
+        """Context manager for metadata file locking (shared for read-only callers; reentrant)"""
+        with self._thread_lock:
+            outermost = self._lock_depth == 0
+            if outermost or (exclusive and not self._lock_exclusive):
+                fcntl.flock(self._lock_fd, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+                self._lock_exclusive = exclusive
+            self._lock_depth += 1
+            try:
+                if outermost:
+                    self._sync_log()
+                yield
+            finally:
+                self._lock_depth -= 1
+                if outermost:
+                    self._lock_exclusive = False
+                    fcntl.flock(self._lock_fd, fcntl.LOCK_UN)
     
     def purge_consumed_files(self):
         """Remove consumed files when buffer exceeds limit (deferred deletion)"""
-        if len(self.metadata["chunks"]) <= MAX_BUFFER_FILES:
+        excess_count = len(self._chunks_by_id) - MAX_BUFFER_FILES
+        if excess_count <= 0:
             return
         
-        # Find consumed files, sorted by creation time (oldest first)
-        consumed_chunks = [c for c in self.metadata["chunks"] if c["consumed"]]
-        consumed_chunks.sort(key=lambda x: x["created_at"])
-        
-        # Calculate how many to remove
-        excess_count = len(self.metadata["chunks"]) - MAX_BUFFER_FILES
-        to_remove = consumed_chunks[:excess_count]
+        # Oldest-first scan; consumed chunks sit at the head, so this stops early
+        consumed = (c for c in self._chunks_by_id.values() if c["consumed"])
+        to_remove = list(islice(consumed, excess_count))
         
         for chunk in to_remove:
             self.delete_chunk_file(chunk)
-            self.metadata["chunks"].remove(chunk)
-            print(f"Purged consumed file: {chunk['filename']}")
+            log.debug("Purged consumed file: %s", chunk["filename"])
         
         if to_remove:
-            print(f"Purged {len(to_remove)} consumed files, buffer size: {len(self.metadata['chunks'])}")
+            log.info("Purged %d consumed files, buffer size: %d", len(to_remove), len(self._chunks_by_id))
 
 if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(message)s")
+    
     # Test buffer manager
     bm = BufferManager()
     status = bm.get_buffer_status()
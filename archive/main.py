@@ -9,15 +9,67 @@ import sys
 import time
 import subprocess
 import signal
+import select
+import logging
+import threading
 from buffer_manager import BufferManager
 from config import *
 
+# Where the encoder publishes the feeder's audio (an rtmp:// URL streams, anything else is written as MPEG-TS)
+STREAM_OUTPUT = os.environ.get("STREAM_OUTPUT", "/root/home_projects/youtube-stream/stream_output.ts")
+
+def encoder_command(output: str) -> list:
+    """ffmpeg reading the feeder's raw PCM from stdin; -re holds it to real time, so the pipe paces the feeder"""
+    return [
+        'ffmpeg', '-hide_banner', '-loglevel', 'warning', '-y',
+        '-re', '-f', 's16le', '-ar', str(SAMPLE_RATE), '-ac', '1', '-i', 'pipe:0',
+        '-c:a', 'aac', '-b:a', '128k',
+        '-f', 'flv' if output.startswith('rtmp') else 'mpegts', output
+    ]
+
+class StatusRefresher(threading.Thread):
+    """Gathers and prints buffer status in the background so supervision never waits on it"""
+    def __init__(self, buffer_manager, interval=60):
+        super().__init__(daemon=True)
+        self.buffer_manager = buffer_manager
+        self.interval = interval
+        self.stop_event = threading.Event()
+        self.lock = threading.Lock()
+        self.latest = None
+    
+    def run(self):
+        while not self.stop_event.is_set():
+            try:
+                status = self.buffer_manager.get_buffer_status()
+                with self.lock:
+                    self.latest = status
+                
+                print(f"\\n=== System Status ===")
+                print(f"Buffer Health: {status['health']}")
+                print(f"Chunks Available: {status['available_chunks']}")
+                print(f"Hours Remaining: {status['hours_remaining']:.1f}")
+            except Exception as e:
+                print(f"Status refresh error: {e}")
+            
+            self.stop_event.wait(self.interval)
+    
+    def get_latest(self):
+        """Most recent buffer status, or None before the first refresh"""
+        with self.lock:
+            return self.latest
+    
+    def stop(self):
+        self.stop_event.set()
+
 class StreamOrchestrator:
     def __init__(self):
         self.buffer_manager = BufferManager()
         self.generator_process = None
         self.feeder_process = None
+        self.encoder_process = None
         self.running = False
+        self._wakeup_r = None
+        self.status_refresher = None
     
     def signal_handler(self, signum, frame):
         """Handle shutdown signals"""
@@ -25,6 +77,9 @@ class StreamOrchestrator:
         self.shutdown()
         sys.exit(0)
     
+    def child_handler(self, signum, frame):
+        """SIGCHLD: the signal wakeup fd already woke the monitor loop, nothing else to do"""
+    
     def start_generator(self):
         """Start audio generator process"""
         print("Starting audio generator...")
@@ -34,27 +89,34 @@ class StreamOrchestrator:
         return self.generator_process
     
     def start_feeder(self):
-        """Start stream feeder process"""
+        """Start stream feeder process, piped into the encoder (its stdout carries only PCM)"""
         print("Starting stream feeder...")
         self.feeder_process = subprocess.Popen([
             sys.executable, "stream_feeder.py"
-        ], cwd="/root/home_projects/youtube-stream")
+        ], cwd="/root/home_projects/youtube-stream", stdout=subprocess.PIPE)
+        
+        print(f"Starting encoder -> {STREAM_OUTPUT}")
+        self.encoder_process = subprocess.Popen(encoder_command(STREAM_OUTPUT), stdin=self.feeder_process.stdout)
+        # The encoder holds the read end now; closing ours lets the feeder see EPIPE if it exits
+        self.feeder_process.stdout.close()
         return self.feeder_process
     
+    def stop_feeder(self):
+        """Stop the feeder and its encoder (they only run as a pair)"""
+        for process in (self.feeder_process, self.encoder_process):
+            if process and process.poll() is None:
+                process.terminate()
+                process.wait()
+    
     def monitor_system(self):
         """Monitor system health and processes"""
         while self.running:
             try:
-                # Check buffer status
-                status = self.buffer_manager.get_buffer_status()
-                
-                print(f"\\n=== System Status ===")
-                print(f"Buffer Health: {status['health']}")
-                print(f"Chunks Available: {status['available_chunks']}")
-                print(f"Hours Remaining: {status['hours_remaining']:.1f}")
+                # Buffer status is gathered (and printed every minute) by the refresher thread
+                status = self.status_refresher.get_latest()
                 
                 # Check if we should emergency shutdown
-                if status['health'] == 'DEPLETED':
+                if status and status['health'] == 'DEPLETED':
                     print("EMERGENCY: Buffer depleted, shutting down...")
                     self.shutdown()
                     break
@@ -64,11 +126,14 @@ class StreamOrchestrator:
                     print("WARNING: Generator process died, restarting...")
                     self.start_generator()
                 
-                if self.feeder_process and self.feeder_process.poll() is not None:
-                    print("WARNING: Feeder process died, restarting...")
+                if self.feeder_process and (self.feeder_process.poll() is not None or self.encoder_process.poll() is not None):
+                    print("WARNING: Feeder or encoder process died, restarting both...")
+                    self.stop_feeder()
                     self.start_feeder()
                 
-                time.sleep(60)  # Check every minute
+                # Re-check every second, or immediately when a child process exits
+                if select.select([self._wakeup_r], [], [], 1.0)[0]:
+                    os.read(self._wakeup_r, 512)
                 
             except KeyboardInterrupt:
                 break
@@ -81,14 +146,16 @@ class StreamOrchestrator:
         print("Shutting down stream system...")
         self.running = False
         
+        if self.status_refresher:
+            self.status_refresher.stop()
+        
         if self.generator_process:
             self.generator_process.terminate()
             self.generator_process.wait()
             print("Generator process stopped")
         
         if self.feeder_process:
-            self.feeder_process.terminate()
-            self.feeder_process.wait()
+            self.stop_feeder()
             print("Feeder process stopped")
     
     def run(self, mode="full"):
@@ -96,6 +163,13 @@ class StreamOrchestrator:
         # Setup signal handlers
         signal.signal(signal.SIGINT, self.signal_handler)
         signal.signal(signal.SIGTERM, self.signal_handler)
+        signal.signal(signal.SIGCHLD, self.child_handler)
+        
+        # A byte lands on this pipe whenever a signal arrives, so monitor_system wakes
+        # as soon as a child exits instead of up to a minute later
+        self._wakeup_r, wakeup_w = os.pipe()
+        os.set_blocking(wakeup_w, False)
+        signal.set_wakeup_fd(wakeup_w)
         
         print("=== Indian Lofi Stream System ===")
         print(f"Mode: {mode}")
@@ -108,7 +182,7 @@ class StreamOrchestrator:
         elif mode == "feeder-only":
             print("Running feeder only...")
             self.start_feeder()
-            self.feeder_process.wait()
+            self.encoder_process.wait()
             
         elif mode == "full":
             print("Running full system...")
@@ -120,6 +194,8 @@ class StreamOrchestrator:
             self.start_feeder()
             
             # Monitor system
+            self.status_refresher = StatusRefresher(self.buffer_manager)
+            self.status_refresher.start()
             self.monitor_system()
         
         else:
@@ -135,6 +211,8 @@ def show_usage():
     print("  status        - Show buffer status")
 
 if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(message)s")
+    
     if len(sys.argv) > 1:
         mode = sys.argv[1]
         
@@ -5,12 +5,19 @@ Feeds audio chunks to output with 3-second breaks between prompts
 """
 
 import os
+import sys
 import time
-import wave
-import numpy as np
+import mmap
+import struct
+import logging
 from buffer_manager import BufferManager
 from config import *
 
+log = logging.getLogger("stream_feeder")
+
+# Silence buffers by duration; the prompt break is always 3 seconds, so this stays tiny
+_SILENCE_CACHE = {}
+
 class StreamFeeder:
     def __init__(self):
         self.buffer_manager = BufferManager()
@@ -18,20 +25,55 @@ class StreamFeeder:
         self.last_prompt_index = None
     
     def create_silence(self, duration_seconds: float) -> bytes:
-        """Create silence audio data"""
-        samples = int(SAMPLE_RATE * duration_seconds)
-        silence = np.zeros(samples, dtype=np.int16)
-        return silence.tobytes()
+        """Create silence audio data (built once per duration)"""
+        silence = _SILENCE_CACHE.get(duration_seconds)
+        if silence is None:
+            silence = bytes(int(SAMPLE_RATE * duration_seconds) * 2)  # int16 zeros
+            _SILENCE_CACHE[duration_seconds] = silence
+        return silence
+    
+    def _wav_data_range(self, data) -> tuple:
+        """Byte range of the PCM payload in a RIFF/WAVE file"""
+        if data[:4] != b'RIFF' or data[8:12] != b'WAVE':
+            raise ValueError("not a WAV file")
+        
+        pos = 12
+        while pos + 8 <= len(data):
+            chunk_id = data[pos:pos + 4]
+            size = struct.unpack_from('<I', data, pos + 4)[0]
+            if chunk_id == b'data':
+                return pos + 8, min(pos + 8 + size, len(data))
+            pos += 8 + size + (size & 1)
+        raise ValueError("no data chunk")
     
-    def read_audio_chunk(self, file_path: str) -> bytes:
-        """Read audio chunk from WAV file"""
+    def read_audio_chunk(self, file_path: str) -> memoryview:
+        """Read audio chunk from WAV file as a zero-copy view of its PCM (mmap, page cache backed)"""
         try:
-            with wave.open(file_path, 'rb') as wav_file:
-                return wav_file.readframes(wav_file.getnframes())
+            with open(file_path, 'rb') as f:
+                mm = mmap.mmap(f.fileno(), 0, prot=mmap.PROT_READ)
+            # Read once front to back: larger readahead while faulting it in
+            if hasattr(mmap, 'MADV_SEQUENTIAL'):
+                mm.madvise(mmap.MADV_SEQUENTIAL)
+            start, end = self._wav_data_range(mm)
+            # Whole int16 samples only: a stray odd byte would misalign every sample after it
+            end -= (end - start) % 2
+            # The view keeps the mapping alive; it is unmapped once the view is dropped
+            return memoryview(mm)[start:end]
         except Exception as e:
-            print(f"Error reading audio chunk {file_path}: {e}")
+            log.error("Error reading audio chunk %s: %s", file_path, e)
             return b''
     
+    def release_audio_chunk(self, audio_data, file_path: str):
+        """Unmap a streamed chunk and drop its pages so played audio does not crowd the page cache"""
+        audio_data.release()
+        if not hasattr(os, 'posix_fadvise'):
+            return
+        fd = os.open(file_path, os.O_RDONLY)
+        try:
+            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+        finally:
+            os.close(fd)
+    
     def should_add_break(self, chunk_info: dict) -> bool:
         """Check if we should add 3-second break between prompts"""
         if self.last_prompt_index is None:
@@ -39,8 +81,9 @@ class StreamFeeder:
         return chunk_info['prompt_index'] != self.last_prompt_index
     
     def stream_to_stdout(self):
-        """Stream audio chunks to stdout (for testing)"""
-        print("Starting stream feeder (outputting to stdout)...")
+        """Stream audio chunks to stdout as raw PCM (pipe into ffmpeg, which paces playback)"""
+        log.info("Starting stream feeder (outputting to stdout)...")
+        out = sys.stdout.buffer
         
         while True:
             try:
@@ -48,45 +91,46 @@ class StreamFeeder:
                 chunk_info = self.buffer_manager.get_next_chunk()
                 
                 if chunk_info is None:
-                    print("No chunks available, waiting...")
+                    log.info("No chunks available, waiting...")
                     time.sleep(5)
                     continue
                 
-                print(f"\\nStreaming chunk {chunk_info['id']}: {chunk_info['filename']}")
-                print(f"Prompt: {chunk_info['prompt'][:50]}...")
+                log.info("Streaming chunk %d: %s", chunk_info['id'], chunk_info['filename'])
+                # Chunks generated before PROMPTS was shortened can point past its end
+                prompt_index = chunk_info['prompt_index']
+                log.info("Prompt: %.50s...", PROMPTS[prompt_index] if prompt_index < len(PROMPTS) else f"unknown (index {prompt_index})")
                 
-                # Add 3-second break if prompt changed
-                if self.should_add_break(chunk_info):
-                    print("Adding 3-second break (prompt change)")
-                    silence = self.create_silence(3.0)
-                    # In real implementation, this would go to FFmpeg
-                    # For testing, we just simulate
-                    time.sleep(0.1)  # Simulate break
-                
-                # Stream the chunk
+                # Stream the chunk; writes block while the downstream reader is behind
                 audio_data = self.read_audio_chunk(chunk_info['path'])
                 if audio_data:
-                    # In real implementation, this would pipe to FFmpeg
-                    # For testing, we simulate streaming time
-                    print(f"Streaming {len(audio_data)} bytes...")
-                    
-                    # Simulate real-time streaming (10 minutes = 600 seconds)
-                    # For testing, we'll just wait 2 seconds
-                    time.sleep(2)
+                    # Add 3-second break if prompt changed
+                    if self.should_add_break(chunk_info):
+                        log.info("Adding 3-second break (prompt change)")
+                        out.write(self.create_silence(3.0))
                     
-                    print(f"✓ Finished streaming chunk {chunk_info['id']}")
+                    out.write(audio_data)
+                    out.flush()
+                    log.info("✓ Finished streaming chunk %d (%d bytes)", chunk_info['id'], len(audio_data))
+                    self.release_audio_chunk(audio_data, chunk_info['path'])
                     
                     # Mark chunk as consumed
                     self.buffer_manager.mark_chunk_consumed(chunk_info['id'])
+                    self.buffer_manager.flush_metadata()
                     self.last_prompt_index = chunk_info['prompt_index']
                 else:
-                    print(f"✗ Failed to read chunk {chunk_info['id']}")
+                    log.error("✗ Failed to read chunk %d", chunk_info['id'])
+                    if self.buffer_manager.verify_chunk(chunk_info):
+                        time.sleep(1)  # back off before retrying the same chunk
+                    self.buffer_manager.flush_metadata()
                 
             except KeyboardInterrupt:
-                print("\\nStream feeder stopped by user")
+                log.info("Stream feeder stopped by user")
+                break
+            except BrokenPipeError:
+                log.info("Downstream closed the stream, stopping")
                 break
             except Exception as e:
-                print(f"Stream feeder error: {e}")
+                log.error("Stream feeder error: %s", e)
                 time.sleep(5)
     
     def get_stream_status(self) -> dict:
@@ -101,5 +145,13 @@ class StreamFeeder:
         }
 
 if __name__ == "__main__":
+    # Logs go to stderr; stdout carries the audio stream
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(message)s")
+    
+    # Raw PCM on a console is noise for the operator and nothing for the stream
+    if sys.stdout.isatty():
+        log.error("stdout is a terminal; pipe the feeder into ffmpeg (main.py does this)")
+        sys.exit(1)
+    
     feeder = StreamFeeder()
     feeder.stream_to_stdout()
\ No newline at end of file
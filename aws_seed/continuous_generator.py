@@ -0,0 +1,290 @@
+#!/usr/bin/env python3
+"""
+GPU-optimized AudioCraft continuous generation for the bootstrap
+Runs in the bootstrap process; the model loads once and is reused for every hour
+"""
+
+import time
+import struct
+import logging
+import statistics
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import torch
+
+# NVML is optional; without it the throttle check is skipped
+try:
+    import pynvml
+except ImportError:
+    pynvml = None
+
+log = logging.getLogger(__name__)
+
+# One progress line per this many chunks (per-chunk lines only at DEBUG)
+PROGRESS_EVERY = 10
+
+# Sleep this long before the next step while the GPU reports thermal slowdown
+THROTTLE_COOLDOWN = 30
+# A step slower than this multiple of the recent median is flagged as stuck/throttled
+SLOW_STEP_FACTOR = 3
+
+nvml_handle = None
+recent_step_times = deque(maxlen=30)
+
+def init_gpu_monitor():
+    """Open an NVML handle for GPU 0 (no-op if pynvml is unavailable)"""
+    global nvml_handle
+    if pynvml is None:
+        log.info("pynvml not installed, thermal throttle checks disabled")
+        return
+    try:
+        pynvml.nvmlInit()
+        nvml_handle = pynvml.nvmlDeviceGetHandleByIndex(0)
+    except pynvml.NVMLError as e:
+        log.warning("NVML unavailable (%s), thermal throttle checks disabled", e)
+
+def cool_down_if_throttled():
+    """Pause before the next step while the GPU is thermally throttling"""
+    if nvml_handle is None:
+        return
+    thermal = (pynvml.nvmlClocksThrottleReasonSwThermalSlowdown |
+               pynvml.nvmlClocksThrottleReasonHwThermalSlowdown |
+               pynvml.nvmlClocksThrottleReasonHwSlowdown)
+    try:
+        reasons = pynvml.nvmlDeviceGetCurrentClocksThrottleReasons(nvml_handle)
+        if reasons & thermal:
+            temp = pynvml.nvmlDeviceGetTemperature(nvml_handle, pynvml.NVML_TEMPERATURE_GPU)
+            sm_clock = pynvml.nvmlDeviceGetClockInfo(nvml_handle, pynvml.NVML_CLOCK_SM)
+            log.warning("GPU thermally throttled (%dC, SM %dMHz), cooling down %ds", temp, sm_clock, THROTTLE_COOLDOWN)
+            time.sleep(THROTTLE_COOLDOWN)
+    except pynvml.NVMLError as e:
+        log.debug("NVML query failed: %s", e)
+
+def record_step_time(step_time):
+    """Track step times and flag steps far slower than the recent median"""
+    if len(recent_step_times) >= 5:
+        median = statistics.median(recent_step_times)
+        if step_time > SLOW_STEP_FACTOR * median:
+            log.warning("slow step: %.1fs vs median %.1fs", step_time, median)
+    recent_step_times.append(step_time)
+
+# Global model instance (load once, reuse for all prompts)
+model = None
+
+def cache_text_conditioning(model):
+    """Memoize the T5 text conditioner output per distinct tokenized batch"""
+    conditioner = model.lm.condition_provider.conditioners.get('description')
+    if conditioner is None:
+        return
+    
+    # Hours reuse the same few prompts, and every continuation sends the same null
+    # description, so the T5 encoder sees a handful of distinct inputs per run
+    cache = {}
+    encode = conditioner.forward
+    
+    def cached_forward(inputs):
+        input_ids = inputs['input_ids']
+        key = (tuple(input_ids.shape), input_ids.cpu().numpy().tobytes())
+        if key not in cache:
+            cache[key] = encode(inputs)
+        return cache[key]
+    
+    conditioner.forward = cached_forward
+
+def load_model(model_size, chunk_duration):
+    """Load MusicGen on the GPU (AudioCraft must be importable)"""
+    global model
+    if model is None:
+        from audiocraft.models import MusicGen
+        from audiocraft.utils.autocast import TorchAutocast
+        
+        # GPU REQUIRED - fail if not available
+        if not torch.cuda.is_available():
+            raise RuntimeError("GPU not available! This script requires CUDA GPU.")
+        
+        device = 'cuda'
+        torch.set_default_device(device)
+        
+        # Start from a clean caching allocator and keep it for the whole run (never
+        # emptied per chunk); capping the fraction leaves headroom against fragmentation
+        torch.cuda.empty_cache()
+        torch.cuda.set_per_process_memory_fraction(0.95)
+        torch.backends.cudnn.benchmark = True
+        torch.set_float32_matmul_precision("high")
+        init_gpu_monitor()
+        
+        log.info("🚀 Loading musicgen-%s on %s...", model_size, device)
+        model = MusicGen.get_pretrained(f"facebook/musicgen-{model_size}")
+        cache_text_conditioning(model)
+        
+        # Half-precision LM weights halve the bytes read per decoded token; MusicGen already
+        # autocasts generation, so match its autocast dtype. EnCodec stays FP32 to avoid clicks.
+        dtype = torch.bfloat16 if torch.cuda.is_bf16_supported() else torch.float16
+        model.lm = model.lm.to(dtype=dtype)
+        model.autocast = TorchAutocast(enabled=True, device_type='cuda', dtype=dtype)
+        log.info("LM running in %s", dtype)
+        
+        # Compile the LM step (CUDA graphs) and the EnCodec decoder
+        if hasattr(torch, "compile"):
+            model.lm.forward = torch.compile(model.lm.forward, mode="reduce-overhead")
+            model.compression_model.decoder = torch.compile(model.compression_model.decoder, mode="reduce-overhead")
+            
+            # Warm-up so compilation happens before the first real hour
+            log.info("Compiling LM forward and decoder (warm-up generation)...")
+            model.set_generation_params(duration=2)
+            with torch.no_grad():
+                model.generate(["warmup"], progress=False)
+        
+        model.set_generation_params(
+            use_sampling=True,
+            top_k=250,
+            top_p=0.0,
+            temperature=1.0,
+            duration=chunk_duration,  # One chunk per call; hours are stitched by continuation
+            cfg_coef=3.0
+        )
+        log.info("✅ Model loaded and ready on %s", device)
+    return model
+
+# Chunk saves overlap the next generation: D2H copies run on a side stream into two
+# alternating pinned host buffers, and the WAV writes happen on a thread pool
+save_pool = ThreadPoolExecutor(max_workers=2)
+copy_stream = None
+host_buffers = [None, None]
+pending_saves = [[], []]
+
+# 16-byte PCM fmt chunk per (sample_rate, channels); only the sizes change per file
+fmt_chunks = {}
+
+def wav_header(num_frames, sample_rate, channels):
+    """Standard 44-byte RIFF/WAVE header for 16-bit PCM"""
+    fmt = fmt_chunks.get((sample_rate, channels))
+    if fmt is None:
+        fmt = struct.pack('<4sIHHIIHH', b'fmt ', 16, 1, channels, sample_rate, sample_rate * channels * 2, channels * 2, 16)
+        fmt_chunks[(sample_rate, channels)] = fmt
+    data_size = num_frames * channels * 2
+    return struct.pack('<4sI4s', b'RIFF', 36 + data_size, b'WAVE') + fmt + struct.pack('<4sI', b'data', data_size)
+
+def save_chunks(host, output_paths, sample_rate, copied):
+    """Thread pool job: wait once for the batch's D2H copy, then write each row's int16 WAV"""
+    copied.synchronize()
+    for pcm, output_path in zip(host, output_paths):
+        frames = pcm.t().contiguous().numpy()  # (channels, samples) -> interleaved frames
+        with open(output_path, 'wb') as f:
+            f.write(wav_header(frames.shape[0], sample_rate, frames.shape[1]))
+            frames.tofile(f)
+
+def wait_for_saves(slot=None):
+    """Block until queued saves finish (one buffer slot, or all); re-raises save errors"""
+    for s in ([slot] if slot is not None else range(len(pending_saves))):
+        futures, pending_saves[s] = pending_saves[s], []
+        for future in futures:
+            future.result()
+
+def queue_chunk_saves(batch_audio, output_paths, sample_rate, chunk_idx):
+    """Copy a batch of chunks to pinned host memory asynchronously and queue their writes"""
+    global copy_stream
+    if copy_stream is None:
+        copy_stream = torch.cuda.Stream()
+    
+    # Quantize to int16 on the GPU: half the bytes over PCIe, and no encoder on the CPU side
+    pcm = (batch_audio.clamp(-1, 1) * 32767).to(torch.int16)
+    
+    # Host buffer slot is free again once the saves queued two chunks ago are done
+    slot = chunk_idx % 2
+    wait_for_saves(slot)
+    host = host_buffers[slot]
+    if host is None or host.shape != pcm.shape:
+        host = torch.empty(pcm.shape, dtype=torch.int16, device='cpu', pin_memory=True)
+        host_buffers[slot] = host
+    
+    copy_stream.wait_stream(torch.cuda.current_stream())
+    with torch.cuda.stream(copy_stream):
+        host.copy_(pcm, non_blocking=True)
+        copied = torch.cuda.Event()
+        copied.record(copy_stream)
+    pcm.record_stream(copy_stream)  # keep GPU memory alive until the copy lands
+    
+    pending_saves[slot] = [save_pool.submit(save_chunks, host, output_paths, sample_rate, copied)]
+
+def generate_seamless_hours(prompts, output_paths, chunk_duration, context_duration):
+    """Generate several seamless hours side by side, one batch row per hour"""
+    # output_paths[row][chunk_idx] is where each hour's chunks are written
+    sample_rate = model.sample_rate
+    context_samples = int(context_duration * sample_rate)
+    chunk_samples = int(chunk_duration * sample_rate)
+    chunks_per_hour = len(output_paths[0])
+    
+    log.debug("Generating %d seamless hour(s): %.50s...", len(prompts), prompts[0])
+    previous_audio = None
+    total_generation_time = 0
+    
+    for chunk_idx in range(chunks_per_hour):
+        cool_down_if_throttled()
+        start_time = time.time()
+        
+        if chunk_idx == 0:
+            # First chunk: generate normally, all hours in one forward pass
+            model.set_generation_params(duration=chunk_duration)
+            with torch.no_grad():
+                wav = model.generate(prompts, progress=False)
+            batch_audio = wav
+        else:
+            # Subsequent chunks: use last 2 seconds of each hour as context. The
+            # continuation's duration includes the context, so ask for context + chunk
+            # or each chunk ends up 2s short and padded with silence.
+            if chunk_idx == 1:
+                model.set_generation_params(duration=chunk_duration + context_duration)
+            context_audio = previous_audio[..., -context_samples:]
+            
+            # Generate continuation (includes 2s overlap + new content)
+            with torch.no_grad():
+                continuation = model.generate_continuation(
+                    context_audio,
+                    prompt_sample_rate=sample_rate,
+                    progress=False
+                )
+            
+            # Remove first 2 seconds (overlap) to get clean 60s chunks
+            batch_audio = continuation[..., context_samples:]
+        
+        # Ensure exactly 60 seconds
+        if batch_audio.shape[-1] > chunk_samples:
+            batch_audio = batch_audio[..., :chunk_samples]
+        elif batch_audio.shape[-1] < chunk_samples:
+            padding = chunk_samples - batch_audio.shape[-1]
+            batch_audio = torch.nn.functional.pad(batch_audio, (0, padding))
+        
+        # Save one chunk per hour (in the background while the next chunk generates)
+        queue_chunk_saves(batch_audio, [paths[chunk_idx] for paths in output_paths], sample_rate, chunk_idx)
+        
+        # Store for next iteration's context
+        previous_audio = batch_audio
+        
+        generation_time = time.time() - start_time
+        total_generation_time += generation_time
+        record_step_time(generation_time)
+        
+        level = logging.INFO if (chunk_idx + 1) % PROGRESS_EVERY == 0 else logging.DEBUG
+        log.log(level, "chunk %d/%d x%d t=%.1fs", chunk_idx + 1, chunks_per_hour, len(prompts), generation_time)
+    
+    # Results are only reported once every file of the batch is on disk
+    wait_for_saves()
+    
+    log.debug("Seamless hours complete: %d chunks created", len(prompts) * chunks_per_hour)
+    return total_generation_time
+
+def generate_hours_with_fallback(prompts, output_paths, chunk_duration, context_duration):
+    """Try the whole batch; on GPU OOM, fall back to one hour at a time"""
+    try:
+        return generate_seamless_hours(prompts, output_paths, chunk_duration, context_duration)
+    except torch.cuda.OutOfMemoryError:
+        if len(prompts) == 1:
+            raise
+        log.warning("Out of GPU memory at batch size %d, falling back to 1", len(prompts))
+        wait_for_saves()  # don't let the aborted batch's writes race the retry
+        torch.cuda.empty_cache()
+        return sum(
+            generate_seamless_hours([prompt], [paths], chunk_duration, context_duration)
+            for prompt, paths in zip(prompts, output_paths)
+        )
@@ -8,35 +8,62 @@ Run this on GPU instance before bootstrap to test prompts and estimate timing
 import sys
 import os
 import time
+import json
 import subprocess
 import torch
 
 # Import config from parent directory
-import importlib.util
-config_path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'config.py')
-spec = importlib.util.spec_from_file_location("config", config_path)
-config = importlib.util.module_from_spec(spec)
-spec.loader.exec_module(config)
-PROMPTS = config.PROMPTS
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from config import PROMPTS
 
 # Validation configuration
 CHUNK_DURATION = 60  # 5 minutes for validation
+BATCH_SIZE = 4  # Prompts per MusicGen forward pass (halved on OOM)
 OUTPUT_DIR = "./prompt_validation"
 
-def create_validation_script(audiocraft_dir, model_size):
+def create_validation_script(audiocraft_dir, model_size, fp16=False, int8=False):
     """Create GPU-optimized AudioCraft validation script"""
     script_content = f'''
 import sys
 sys.path.append("{audiocraft_dir}")
 import torch
 import os
+import json
 import time
+from concurrent.futures import ThreadPoolExecutor
 from audiocraft.models import MusicGen
 from audiocraft.data.audio import audio_write
 
 # Global model instance (load once, reuse for all prompts)
 model = None
 
+def quantize_lm(model):
+    """Swap the LM's Linear layers for int8 weight-only versions (activations stay FP16)"""
+    try:
+        import bitsandbytes as bnb
+    except ImportError:
+        print("bitsandbytes not installed, keeping LM weights in FP16")
+        return
+    
+    def swap(module):
+        for name, child in module.named_children():
+            if isinstance(child, torch.nn.Linear):
+                int8_linear = bnb.nn.Linear8bitLt(
+                    child.in_features, child.out_features,
+                    bias=child.bias is not None, has_fp16_weights=False
+                )
+                int8_linear.weight = bnb.nn.Int8Params(
+                    child.weight.data.cpu(), requires_grad=False, has_fp16_weights=False
+                )
+                if child.bias is not None:
+                    int8_linear.bias = child.bias
+                setattr(module, name, int8_linear.to('cuda'))
+            else:
+                swap(child)
+    
+    swap(model.lm)
+    print(f"LM quantized to int8")
+
 def load_model():
     global model
     if model is None:
@@ -45,9 +72,33 @@ def load_model():
             raise RuntimeError("GPU not available! This script requires CUDA GPU.")
         
         device = 'cuda'
+        torch.backends.cuda.matmul.allow_tf32 = True
+        torch.backends.cudnn.benchmark = True  # Shapes are fixed for the whole run
         
         print(f"Loading model on {{device}} ({{torch.cuda.get_device_name(0)}})...")
         model = MusicGen.get_pretrained(f"facebook/musicgen-{model_size}")
+        model.lm.eval()
+        
+        # Optional half-precision LM (--fp16); EnCodec stays FP32 to avoid clicks
+        if {fp16}:
+            from audiocraft.utils.autocast import TorchAutocast
+            model.lm = model.lm.to(dtype=torch.float16)
+            model.autocast = TorchAutocast(enabled=True, device_type='cuda', dtype=torch.float16)
+            print(f"LM running in {{torch.float16}}")
+        
+        # Optional int8 LM weights (--int8, implies --fp16)
+        if {int8}:
+            quantize_lm(model)
+        
+        # Compile the LM step (CUDA graphs)
+        if hasattr(torch, "compile"):
+            model.lm.forward = torch.compile(model.lm.forward, mode="reduce-overhead")
+            
+            # Warm-up so compilation happens before the first real prompt
+            print(f"Compiling LM forward (warm-up generation)...")
+            model.set_generation_params(duration=2)
+            with torch.inference_mode():
+                model.generate(["warmup"], progress=False)
         
         print(f"Model loaded and optimized for GPU")
         
@@ -62,30 +113,112 @@ def load_model():
         print(f"Model loaded and ready on {{device}}")
     return model
 
-def generate_sample(prompt, output_path):
+# Saves overlap the next batch's generation: D2H copies run on a side stream into
+# two alternating pinned host buffers, and the WAV writes happen on a background thread
+save_pool = ThreadPoolExecutor(max_workers=1)
+copy_stream = None
+host_buffers = [None, None]
+pending_saves = [None, None]
+
+def save_batch(host, output_paths, sample_rate, copied):
+    """Background job: wait once for the batch's D2H copy, then write each 16-bit WAV"""
+    # Save as WAV directly without ffmpeg dependency (the WAV encoder is CPU-only)
+    import torchaudio
+    copied.synchronize()
+    for wav, output_path in zip(host, output_paths):
+        torchaudio.save(output_path, wav, sample_rate, encoding="PCM_S", bits_per_sample=16)
+
+def queue_batch_save(wavs, output_paths, slot):
+    """Copy a batch to pinned host memory asynchronously and queue its writes"""
+    global copy_stream
+    if copy_stream is None:
+        copy_stream = torch.cuda.Stream()
+    
+    # Quantize to int16 on the GPU: half the bytes over PCIe
+    pcm = (wavs.clamp(-1, 1) * 32767).to(torch.int16)
+    
+    # Host buffer slot is free again once the save queued two batches ago is done
+    if pending_saves[slot] is not None:
+        pending_saves[slot].exception()
+    host = host_buffers[slot]
+    if host is None or host.shape != pcm.shape:
+        host = torch.empty(pcm.shape, dtype=torch.int16, device='cpu', pin_memory=True)
+        host_buffers[slot] = host
+    
+    copy_stream.wait_stream(torch.cuda.current_stream())
+    with torch.cuda.stream(copy_stream):
+        host.copy_(pcm, non_blocking=True)
+        copied = torch.cuda.Event()
+        copied.record(copy_stream)
+    pcm.record_stream(copy_stream)  # keep GPU memory alive until the copy lands
+    
+    pending_saves[slot] = save_pool.submit(save_batch, host, output_paths, model.sample_rate, copied)
+    return pending_saves[slot]
+
+def generate_batch(prompts, output_paths, slot):
     model = load_model()
     
-    print(f"Generating {CHUNK_DURATION}s audio: {{prompt[:50]}}...")
+    print(f"Generating {{len(prompts)}} x {CHUNK_DURATION}s audio: {{prompts[0][:50]}}...")
     start_time = time.time()
     
-    # Use AudioCraft's built-in progress display
-    with torch.no_grad():
-        wav = model.generate([prompt], progress=True)
+    # One forward pass for the whole batch
+    with torch.inference_mode():
+        wavs = model.generate(prompts, progress=False)
     
     generation_time = time.time() - start_time
-    print(f"\\nGeneration completed in {{generation_time:.1f}}s ({{60/generation_time:.2f}}x realtime)")
+    print(f"\\nGeneration completed in {{generation_time:.1f}}s ({{{CHUNK_DURATION}*len(prompts)/generation_time:.2f}}x realtime)")
     
-    # Save as WAV directly without ffmpeg dependency
-    import torchaudio
-    torchaudio.save(output_path, wav[0].cpu(), model.sample_rate)
+    # Batch time is split evenly across its prompts
+    results = [(output_path, generation_time / len(prompts)) for output_path in output_paths]
+    return results, queue_batch_save(wavs, output_paths, slot)
+
+def report(results, saved=None):
+    """Print one RESULT/FAILED line per prompt once its file is written"""
+    try:
+        if saved is not None:
+            saved.result()
+    except Exception as e:
+        results = [(result_path, e) for result_path, _ in results]
     
-    return output_path, generation_time
+    for result_path, outcome in results:
+        if isinstance(outcome, Exception):
+            print(f"FAILED:{{result_path}}:{{outcome}}", flush=True)
+        else:
+            print(f"RESULT:{{result_path}}:{{outcome}}", flush=True)
 
 if __name__ == "__main__":
-    prompt = sys.argv[1]
-    output_path = sys.argv[2]
-    result_path, gen_time = generate_sample(prompt, output_path)
-    print(f"RESULT:{{result_path}}:{{gen_time}}")
+    # One process for every prompt: [[prompt, output_path], ...] as JSON on stdin,
+    # one RESULT/FAILED line per prompt on stdout as each finishes
+    jobs = json.loads(sys.stdin.read())
+    load_model()
+    
+    batch_size = {BATCH_SIZE}
+    batch_count = 0
+    previous = None  # (results, save future) of the batch still being written
+    start = 0
+    while start < len(jobs):
+        batch = jobs[start:start + batch_size]
+        try:
+            current = generate_batch([prompt for prompt, _ in batch], [path for _, path in batch], batch_count % 2)
+        except torch.cuda.OutOfMemoryError as e:
+            torch.cuda.empty_cache()
+            if batch_size > 1:
+                batch_size //= 2
+                print(f"Out of GPU memory, retrying with batch size {{batch_size}}")
+                continue
+            current = ([(path, e) for _, path in batch], None)
+        except Exception as e:
+            current = ([(path, e) for _, path in batch], None)
+        
+        # The previous batch was saving while this one generated
+        if previous:
+            report(*previous)
+        previous = current
+        batch_count += 1
+        start += len(batch)
+    
+    if previous:
+        report(*previous)
 '''
     
     script_path = "/tmp/prompt_validator.py"
@@ -93,45 +226,78 @@ if __name__ == "__main__":
         f.write(script_content)
     return script_path
 
-def validate_single_prompt(prompt_index, prompt, validation_script, audiocraft_venv, audiocraft_dir):
-    """Generate validation sample for a single prompt"""
-    filename = f"prompt_{prompt_index:02d}_{CHUNK_DURATION}s.wav"
-    output_path = os.path.abspath(os.path.join(OUTPUT_DIR, filename))
-    
-    print(f"\n[{prompt_index+1:02d}/10] {filename}")
-    print(f"Prompt: {prompt}")
-    
-    start_time = time.time()
+def validate_prompts(prompts, validation_script, audiocraft_venv, audiocraft_dir):
+    """Generate validation samples for all prompts in a single worker process"""
+    output_paths = []
+    for prompt_index in range(len(prompts)):
+        filename = f"prompt_{prompt_index:02d}_{CHUNK_DURATION}s.wav"
+        output_paths.append(os.path.abspath(os.path.join(OUTPUT_DIR, filename)))
     
+    results = [(False, 0)] * len(prompts)
     try:
-        cmd = [audiocraft_venv, validation_script, prompt, output_path]
-        result = subprocess.run(cmd, text=True, cwd=audiocraft_dir)
+        worker = subprocess.Popen(
+            [audiocraft_venv, validation_script],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            text=True,
+            bufsize=1,
+            cwd=audiocraft_dir
+        )
+        worker.stdin.write(json.dumps([list(job) for job in zip(prompts, output_paths)]))
+        worker.stdin.close()
         
-        if result.returncode == 0 and os.path.exists(output_path):
-            generation_time = time.time() - start_time
-            file_size = os.path.getsize(output_path) / (1024*1024)
-            print(f"✓ Completed in {generation_time:.1f}s ({file_size:.1f}MB)")
-            return True, generation_time
-        else:
-            print(f"✗ Failed (return code: {result.returncode})")
-            return False, 0
+        # The worker handles prompts in order and reports each one as it finishes
+        prompt_index = 0
+        print(f"\n[01/{len(prompts):02d}] {os.path.basename(output_paths[0])}")
+        print(f"Prompt: {prompts[0]}")
+        for line in worker.stdout:
+            line = line.rstrip("\n")
+            if line.startswith("RESULT:"):
+                output_path, gen_time = line[len("RESULT:"):].rsplit(":", 1)
+                try:
+                    file_size = os.stat(output_path).st_size / (1024*1024)
+                    print(f"✓ Completed in {float(gen_time):.1f}s ({file_size:.1f}MB)")
+                    results[prompt_index] = (True, float(gen_time))
+                except FileNotFoundError:
+                    print(f"✗ Failed (no output file)")
+            elif line.startswith("FAILED:"):
+                print(f"✗ Failed: {line[len('FAILED:') + len(output_paths[prompt_index]) + 1:]}")
+            else:
+                print(line)
+                continue
+            
+            prompt_index += 1
+            if prompt_index < len(prompts):
+                print(f"\n[{prompt_index+1:02d}/{len(prompts):02d}] {os.path.basename(output_paths[prompt_index])}")
+                print(f"Prompt: {prompts[prompt_index]}")
+        
+        worker.wait()
+        if worker.returncode != 0:
+            print(f"✗ Worker exited with return code {worker.returncode}")
             
     except Exception as e:
         print(f"✗ Error: {e}")
-        return False, 0
+    
+    return results
 
 def main():
-    if len(sys.argv) < 2:
-        print("Usage: python validate_prompts.py <audiocraft_directory> [model_size]")
+    int8 = "--int8" in sys.argv
+    fp16 = "--fp16" in sys.argv or int8
+    args = [arg for arg in sys.argv[1:] if arg not in ("--fp16", "--int8")]
+    
+    if len(args) < 1:
+        print("Usage: python validate_prompts.py <audiocraft_directory> [model_size] [--fp16] [--int8]")
         print("Example: python validate_prompts.py /path/to/audiocraft small")
         print("Model sizes: small, medium, large (default: small)")
+        print("--fp16: run the language model in half precision")
+        print("--int8: int8 language model weights via bitsandbytes (implies --fp16)")
         print("")
         print("This script validates all 10 prompts by generating 5-minute samples.")
         print("Run this before bootstrap to test audio quality and estimate timing.")
         sys.exit(1)
     
-    audiocraft_dir = os.path.abspath(sys.argv[1])
-    model_size = sys.argv[2] if len(sys.argv) > 2 else "small"
+    audiocraft_dir = os.path.abspath(args[0])
+    model_size = args[1] if len(args) > 1 else "small"
     audiocraft_venv = os.path.join(audiocraft_dir, "my_venv", "bin", "python")
     
     # Validate paths
@@ -158,6 +324,7 @@ def main():
     print(f"AudioCraft venv: {audiocraft_venv}")
     print(f"GPU device: {torch.cuda.get_device_name(0)}")
     print(f"GPU memory: {torch.cuda.get_device_properties(0).total_memory / 1024**3:.1f}GB")
+    print(f"Precision: {'int8' if int8 else 'FP16' if fp16 else 'FP32'} LM")
     print(f"Sample duration: {CHUNK_DURATION} seconds ({CHUNK_DURATION/60:.1f} minutes)")
     print(f"Total prompts: {len(PROMPTS)}")
     print()
@@ -166,17 +333,16 @@ def main():
     os.makedirs(OUTPUT_DIR, exist_ok=True)
     
     # Create validation script
-    validation_script = create_validation_script(audiocraft_dir, model_size)
+    validation_script = create_validation_script(audiocraft_dir, model_size, fp16, int8)
     
     # Track validation
     successful_prompts = []
     failed_prompts = []
     total_start_time = time.time()
     
-    # Validate all prompts
-    for prompt_index, prompt in enumerate(PROMPTS):
-        success, gen_time = validate_single_prompt(prompt_index, prompt, validation_script, audiocraft_venv, audiocraft_dir)
-        
+    # Validate all prompts (model loads once, in one worker process)
+    results = validate_prompts(PROMPTS, validation_script, audiocraft_venv, audiocraft_dir)
+    for prompt_index, (prompt, (success, gen_time)) in enumerate(zip(PROMPTS, results)):
         if success:
             successful_prompts.append({
                 "index": prompt_index,
@@ -13,6 +13,8 @@ AUDIOCRAFT_VENV = "/usr/bin/python3"
 CHUNK_DURATION = 30   # 30 seconds for new architecture
 MODEL_SIZE = "small"
 SAMPLE_RATE = 32000
+GENERATION_BATCH_SIZE = 4  # Chunks generated per MusicGen forward pass (falls back to 1 on OOM)
+QUANTIZE_LM_INT8 = False  # int8 weight-only MusicGen LM (bitsandbytes on GPU, dynamic quant on CPU)
 
 # Content Library Management (1 month base + weekly additions)
 BASE_CONTENT_FILES = 86400  # 1 month × 24h × 60min × 2 = 86,400 files
@@ -29,7 +31,7 @@ PROMPT_DURATION_HOURS = 1  # Each prompt plays for 1 hour
 CHUNKS_PER_PROMPT = 120    # 120 × 30s = 1 hour per prompt
 
 # Indian Lofi Prompts (10 prompts rotating)
-PROMPTS = [
+PROMPTS = (
     "gentle indian lofi hip hop with smooth sarod, subdued drums, and warm room tone",
     "low-key indian lofi hip hop with muted sitar, soft percussion, and subtle breeze textures",
     "quiet indian lofi hip hop with distant sarangi, hushed drums, and misty ambience",
@@ -40,7 +42,7 @@ PROMPTS = [
     "dreamy indian lofi hip hop with flute melody, tabla beats, and monsoon rain ambience",
     "smooth indian lofi hip hop with electric sitar, mellow drums, and ambient texture",
     "nostalgic indian lofi hip hop with santoor, gentle drums, and street sounds",
-]
+)
 
 # Performance Metrics (updated for 30s chunks)
 GENERATION_TIME_PER_CHUNK = 6 * 60  # 6 minutes per 30-second chunk (estimated)
@@ -6,11 +6,29 @@ Manages 30-second chunks for 1-month base content + weekly additions
 
 import os
 import json
-import glob
 import time
+import shutil
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
 from typing import List, Dict, Optional
 from config import *
 
+# orjson serializes library metadata in C; stdlib json is the fallback
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+def _json_dumps(obj) -> bytes:
+    """Compact JSON as bytes"""
+    if orjson:
+        return orjson.dumps(obj)
+    return json.dumps(obj, separators=(',', ':')).encode()
+
+def _json_loads(data: bytes):
+    """Parse JSON bytes (decode errors are ValueError either way)"""
+    return orjson.loads(data) if orjson else json.loads(data)
+
 class ContentLibrary:
     def __init__(self):
         self.library_dir = "/root/home_projects/youtube-stream/content_library"
@@ -18,6 +36,21 @@ class ContentLibrary:
         self.weekly_dir = os.path.join(self.library_dir, "weekly_additions")
         self.stitched_dir = os.path.join(self.library_dir, "stitched_streams")
         self.metadata_file = os.path.join(self.library_dir, "library_metadata.json")
+        # Base chunks only change when scan_base_content() runs, so their catalog is a
+        # separate file written then, not on every save
+        self.base_chunks_file = os.path.join(self.library_dir, "base_content.jsonl")
+        self._base_dirty = False  # Base catalog needs writing (after a scan or a migration)
+        # Weekly chunks live in a newline-delimited sidecar (one JSON object per line), so
+        # library_metadata.json stays a small header and chunks are parsed line by line
+        self.weekly_chunks_file = os.path.join(self.library_dir, "weekly_chunks.jsonl")
+        self._weekly_saved = 0  # Weekly chunks already in the sidecar (-1: needs a full rewrite)
+        # Stitched playlists are an append-only log the same way, one record per stitch
+        self.stitched_streams_file = os.path.join(self.library_dir, "stitched_streams.jsonl")
+        self._playlists_saved = 0
+        
+        # Memoized get_all_chunks/get_library_stats results, dropped whenever chunks change
+        self._all_chunks = None
+        self._stats = None
         
         self._ensure_directories()
         self.load_metadata()
@@ -29,9 +62,32 @@ class ContentLibrary:
     
     def load_metadata(self):
         """Load or create library metadata"""
+        self._chunks_changed()
         if os.path.exists(self.metadata_file):
-            with open(self.metadata_file, 'r') as f:
-                self.metadata = json.load(f)
+            with open(self.metadata_file, 'rb') as f:
+                self.metadata = _json_loads(f.read())
+            
+            # Older libraries kept base chunks inline; they move to the catalog on the next save
+            base = self.metadata["base_content"]
+            if "chunks" in base:
+                self._base_dirty = True
+            else:
+                base["chunks"], intact = self._read_jsonl(self.base_chunks_file)
+                self._base_dirty = not intact
+            
+            # Older libraries kept weekly chunks inline (and again per week); they move
+            # to the sidecar on the next save
+            weekly = self.metadata["weekly_additions"]
+            for week in weekly["weeks"]:
+                week.pop("chunks", None)
+            if "chunks" not in weekly:
+                weekly["chunks"], intact = self._read_jsonl(self.weekly_chunks_file)
+                self._weekly_saved = len(weekly["chunks"]) if intact else -1
+            
+            stitched = self.metadata["stitched_streams"]
+            if "playlists" not in stitched:
+                stitched["playlists"], intact = self._read_jsonl(self.stitched_streams_file)
+                self._playlists_saved = len(stitched["playlists"]) if intact else -1
         else:
             self.metadata = {
                 "base_content": {"chunks": [], "total_duration_hours": 0},
@@ -39,28 +95,63 @@ class ContentLibrary:
                 "stitched_streams": {"playlists": []},
                 "last_updated": time.time()
             }
+            self._base_dirty = True
             self.save_metadata()
+        
+        # Weekly chunk counts keyed by week id (session ids "<week>_s<ts>" count toward their week)
+        self._week_counts = Counter(self._week_key(c["week_added"]) for c in self.metadata["weekly_additions"]["chunks"])
+    
+    @staticmethod
+    def _week_key(week_added: str) -> str:
+        """Week id a chunk's week_added belongs to"""
+        return week_added.split("_s", 1)[0]
+    
+    def _read_jsonl(self, path: str) -> tuple:
+        """Load a sidecar's records line by line; returns (records, intact)"""
+        records = []
+        if not os.path.exists(path):
+            return records, True
+        with open(path, 'rb') as f:
+            for line in f:
+                try:
+                    records.append(_json_loads(line))
+                except ValueError:
+                    # Torn final line from an interrupted append; rewrite the sidecar on next save
+                    print(f"Ignoring truncated record in {path}")
+                    return records, False
+        return records, True
+    
+    def _append_jsonl(self, path: str, records: List[Dict], saved: int) -> int:
+        """Append records[saved:] to a sidecar (full rewrite if saved <= 0); returns the new saved count"""
+        with open(path, 'ab' if saved > 0 else 'wb') as f:
+            f.write(b"".join(_json_dumps(record) + b"\n" for record in records[max(saved, 0):]))
+            f.flush()
+            os.fsync(f.fileno())
+        return len(records)
     
     def scan_base_content(self):
         """Scan and catalog base content (30-second chunks)"""
-        wav_files = glob.glob(os.path.join(self.base_dir, "*.wav"))
-        wav_files.sort()
+        # Single readdir pass; DirEntry caches the stat result (same files glob("*.wav") matched)
+        with os.scandir(self.base_dir) as it:
+            wav_files = [entry for entry in it if entry.name.endswith(".wav") and not entry.name.startswith(".")]
+        wav_files.sort(key=lambda entry: entry.name)
         
         chunks = []
-        for i, file_path in enumerate(wav_files):
-            filename = os.path.basename(file_path)
+        for i, entry in enumerate(wav_files):
             chunk_info = {
                 "id": i + 1,
-                "filename": filename,
-                "path": file_path,
+                "filename": entry.name,
+                "path": entry.path,
                 "duration": 30,
-                "created_at": os.path.getctime(file_path),
+                "created_at": entry.stat().st_ctime,
                 "week_added": "base"
             }
             chunks.append(chunk_info)
         
         self.metadata["base_content"]["chunks"] = chunks
         self.metadata["base_content"]["total_duration_hours"] = len(chunks) * 30 / 3600
+        self._base_dirty = True
+        self._chunks_changed()
         self.save_metadata()
         
         print(f"Cataloged {len(chunks)} base content chunks ({len(chunks) * 30 / 3600:.1f} hours)")
@@ -69,15 +160,21 @@ class ContentLibrary:
     def add_weekly_content(self, week_id: str, chunk_files: List[str]):
         """Add weekly generated content to library"""
         week_chunks = []
+        next_id = len(self.get_all_chunks()) + 1
         
-        for file_path in chunk_files:
-            filename = os.path.basename(file_path)
-            # Move to weekly directory
-            dest_path = os.path.join(self.weekly_dir, f"week_{week_id}_{filename}")
-            os.rename(file_path, dest_path)
-            
+        # Move to weekly directory; the moves are syscall-bound, so overlap them on threads.
+        # shutil.move falls back to copy+delete when the session's temp dir is on another device.
+        # Sessions all name their files chunk_000..., so the library id keeps destinations unique
+        dest_paths = [
+            os.path.join(self.weekly_dir, f"week_{week_id}_{chunk_id:06d}_{os.path.basename(file_path)}")
+            for chunk_id, file_path in enumerate(chunk_files, start=next_id)
+        ]
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            list(pool.map(shutil.move, chunk_files, dest_paths))
+        
+        for dest_path in dest_paths:
             chunk_info = {
-                "id": len(self.get_all_chunks()) + 1,
+                "id": next_id,
                 "filename": os.path.basename(dest_path),
                 "path": dest_path,
                 "duration": 30,
@@ -85,49 +182,96 @@ class ContentLibrary:
                 "week_added": week_id
             }
             week_chunks.append(chunk_info)
+            next_id += 1
         
         # Add to metadata
         week_entry = {
             "week_id": week_id,
-            "chunks": week_chunks,
             "added_at": time.time(),
             "chunk_count": len(week_chunks)
         }
         
         self.metadata["weekly_additions"]["weeks"].append(week_entry)
         self.metadata["weekly_additions"]["chunks"].extend(week_chunks)
+        self._chunks_changed()
+        self._week_counts[self._week_key(week_id)] += len(week_chunks)
         self.save_metadata()
         
         print(f"Added {len(week_chunks)} chunks for week {week_id}")
         return week_chunks
     
+    def _chunks_changed(self):
+        """Drop memoized chunk views after the chunk lists change"""
+        self._all_chunks = None
+        self._stats = None
+    
     def get_all_chunks(self) -> List[Dict]:
-        """Get all available chunks (base + weekly)"""
-        all_chunks = []
-        all_chunks.extend(self.metadata["base_content"]["chunks"])
-        all_chunks.extend(self.metadata["weekly_additions"]["chunks"])
-        return all_chunks
+        """Get all available chunks (base + weekly); shared list, do not modify"""
+        if self._all_chunks is None:
+            all_chunks = []
+            all_chunks.extend(self.metadata["base_content"]["chunks"])
+            all_chunks.extend(self.metadata["weekly_additions"]["chunks"])
+            self._all_chunks = all_chunks
+        return self._all_chunks
+    
+    def get_week_chunk_count(self, week_id: str) -> int:
+        """Number of weekly chunks added for a week (including its sessions)"""
+        return self._week_counts[week_id]
     
     def get_library_stats(self) -> Dict:
         """Get library statistics"""
-        all_chunks = self.get_all_chunks()
-        total_hours = len(all_chunks) * 30 / 3600
-        
-        return {
-            "total_chunks": len(all_chunks),
-            "base_chunks": len(self.metadata["base_content"]["chunks"]),
-            "weekly_chunks": len(self.metadata["weekly_additions"]["chunks"]),
-            "total_hours": total_hours,
-            "total_days": total_hours / 24,
-            "weeks_added": len(self.metadata["weekly_additions"]["weeks"]),
-            "storage_gb": len(all_chunks) * 1.9 / 1024  # Estimate 1.9MB per 30s chunk
-        }
+        if self._stats is None:
+            all_chunks = self.get_all_chunks()
+            total_hours = len(all_chunks) * 30 / 3600
+            
+            self._stats = {
+                "total_chunks": len(all_chunks),
+                "base_chunks": len(self.metadata["base_content"]["chunks"]),
+                "weekly_chunks": len(self.metadata["weekly_additions"]["chunks"]),
+                "total_hours": total_hours,
+                "total_days": total_hours / 24,
+                "weeks_added": len(self.metadata["weekly_additions"]["weeks"]),
+                "storage_gb": len(all_chunks) * 1.9 / 1024  # Estimate 1.9MB per 30s chunk
+            }
+        return dict(self._stats)
+    
+    def add_stitched_stream(self, stream_info: Dict):
+        """Record a stitched stream by appending one line to the playlist log"""
+        self.metadata["stitched_streams"]["playlists"].append(stream_info)
+        if self._playlists_saved <= 0:
+            # Migration or torn log pending: rewrite everything (including the header) once
+            self.save_metadata()
+        else:
+            self._playlists_saved = self._append_jsonl(
+                self.stitched_streams_file, self.metadata["stitched_streams"]["playlists"], self._playlists_saved
+            )
     
     def save_metadata(self):
-        """Save library metadata"""
+        """Save library metadata header; weekly chunks are appended to the sidecar"""
         self.metadata["last_updated"] = time.time()
-        with open(self.metadata_file, 'w') as f:
-            json.dump(self.metadata, f, indent=2)
+        base = self.metadata["base_content"]
+        weekly = self.metadata["weekly_additions"]
+        
+        if self._base_dirty:
+            self._append_jsonl(self.base_chunks_file, base["chunks"], 0)
+            self._base_dirty = False
+        
+        # Only records added since the last save are written (full rewrite after a
+        # migration or a torn sidecar)
+        self._weekly_saved = self._append_jsonl(self.weekly_chunks_file, weekly["chunks"], self._weekly_saved)
+        self._playlists_saved = self._append_jsonl(
+            self.stitched_streams_file, self.metadata["stitched_streams"]["playlists"], self._playlists_saved
+        )
+        
+        # Header carries everything except the sidecar lists themselves
+        header = dict(
+            self.metadata,
+            base_content={"total_duration_hours": base["total_duration_hours"]},
+            weekly_additions={"weeks": weekly["weeks"]},
+            stitched_streams={}
+        )
+        with open(self.metadata_file, 'wb') as f:
+            f.write(_json_dumps(header))
 
 if __name__ == "__main__":
     library = ContentLibrary()
@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""
+FFmpeg runner shared by the stitcher and the streamer
+Reads ffmpeg's stderr as it runs: reports progress, keeps only the tail for errors
+"""
+
+import os
+import re
+import subprocess
+import threading
+from collections import deque
+from typing import List, Optional, Tuple
+
+# -progress writes key=value lines; everything else on stderr is ffmpeg's own log
+PROGRESS_LINE = re.compile(rb'^[a-z0-9_]+=\S*$')
+
+def _write_input(process: subprocess.Popen, input_data: bytes):
+    """Hand ffmpeg its stdin input (e.g. a concat list) in one write"""
+    try:
+        process.stdin.write(input_data)
+        process.stdin.close()
+    except BrokenPipeError:
+        pass  # ffmpeg exited early; its log says why
+
+def run_ffmpeg(cmd: List[str], total_seconds: Optional[float] = None, input_data: Optional[bytes] = None) -> Tuple[int, str]:
+    """Run an ffmpeg command, optionally feeding input_data on stdin; returns (returncode, last lines of its log)"""
+    cmd = cmd[:1] + ['-nostats', '-progress', 'pipe:2'] + cmd[1:]
+    process = subprocess.Popen(
+        cmd,
+        stdin=subprocess.DEVNULL if input_data is None else subprocess.PIPE,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE
+    )
+    
+    # Written from a thread so a large input can never deadlock against stderr
+    if input_data is not None:
+        threading.Thread(target=_write_input, args=(process, input_data), daemon=True).start()
+    
+    tail = deque(maxlen=512)
+    reported = 0
+    for line in process.stderr:
+        if line.startswith(b'out_time_us='):
+            if not total_seconds:
+                continue
+            try:
+                percent = int(line[len(b'out_time_us='):]) / 1e6 / total_seconds * 100
+            except ValueError:
+                continue  # N/A before the first frame
+            if percent >= reported + 10:
+                reported = int(percent // 10 * 10)
+                print(f"  {reported}% done")
+        elif not PROGRESS_LINE.match(line.strip()):
+            tail.append(line)
+    
+    returncode = process.wait()
+    return returncode, b''.join(tail).decode(errors='replace')
+
+def drop_from_page_cache(path: str):
+    """Flush a freshly written output and evict it from the page cache"""
+    if not hasattr(os, 'posix_fadvise'):
+        return
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        # Dirty pages cannot be dropped, so write them back first
+        os.fdatasync(fd)
+        os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+    finally:
+        os.close(fd)
@@ -6,15 +6,24 @@ Manages content library, scheduled generation, and stream stitching
 
 import sys
 import os
+from functools import cached_property
 from content_library import ContentLibrary
 from stream_stitcher import StreamStitcher
 from scheduled_generator import ScheduledGenerator
 
 class NewStreamOrchestrator:
-    def __init__(self):
-        self.library = ContentLibrary()
-        self.stitcher = StreamStitcher()
-        self.generator = ScheduledGenerator()
+    # Subsystems are built on first use, so a command only loads what it touches
+    @cached_property
+    def library(self) -> ContentLibrary:
+        return ContentLibrary()
+    
+    @cached_property
+    def stitcher(self) -> StreamStitcher:
+        return StreamStitcher()
+    
+    @cached_property
+    def generator(self) -> ScheduledGenerator:
+        return ScheduledGenerator()
     
     def setup_library(self):
         """Initial setup: scan existing content"""
@@ -12,16 +12,18 @@ from datetime import datetime
 from content_library import ContentLibrary
 import sys
 import os
+import json
 import subprocess
 import tempfile
 from datetime import datetime
 from typing import List, Dict
 from content_library import ContentLibrary
-from config import PROMPTS, AUDIOCRAFT_VENV, CHUNK_DURATION
+from config import PROMPTS, AUDIOCRAFT_VENV, CHUNK_DURATION, GENERATION_BATCH_SIZE, QUANTIZE_LM_INT8
 
 class AudioGenerator:
     def __init__(self):
         self.generation_script = self._create_generation_script()
+        self.worker = None
     
     def _create_generation_script(self) -> str:
         """Create temporary script for AudioCraft generation"""
@@ -30,13 +32,65 @@ import sys
 sys.path.append("/root/home_projects/audiocraft")
 import torch
 import os
+import json
 import time
+from concurrent.futures import ThreadPoolExecutor
 from audiocraft.models import MusicGen
 from audiocraft.data.audio import audio_write
 
 # Global model instance (load once, reuse for all chunks)
 model = None
 
+def quantize_lm(model, device):
+    """Swap the LM's Linear layers for int8 weight-only versions"""
+    if device != 'cuda':
+        model.lm = torch.ao.quantization.quantize_dynamic(model.lm, {{torch.nn.Linear}}, dtype=torch.qint8)
+        return
+    
+    try:
+        import bitsandbytes as bnb
+    except ImportError:
+        print("bitsandbytes not installed, keeping LM weights in half precision")
+        return
+    
+    def swap(module):
+        for name, child in module.named_children():
+            if isinstance(child, torch.nn.Linear):
+                int8_linear = bnb.nn.Linear8bitLt(
+                    child.in_features, child.out_features,
+                    bias=child.bias is not None, has_fp16_weights=False
+                )
+                int8_linear.weight = bnb.nn.Int8Params(
+                    child.weight.data.cpu(), requires_grad=False, has_fp16_weights=False
+                )
+                if child.bias is not None:
+                    int8_linear.bias = child.bias
+                setattr(module, name, int8_linear.to(device))
+            else:
+                swap(child)
+    
+    swap(model.lm)
+    print(f"LM quantized to int8")
+
+def cache_text_conditioning(model):
+    """Memoize the T5 text conditioner output per distinct tokenized batch"""
+    conditioner = model.lm.condition_provider.conditioners.get('description')
+    if conditioner is None:
+        return
+    
+    # Every session sends the same prompt batches, so T5 only runs for the first one
+    cache = {{}}
+    encode = conditioner.forward
+    
+    def cached_forward(inputs):
+        input_ids = inputs['input_ids']
+        key = (tuple(input_ids.shape), input_ids.cpu().numpy().tobytes())
+        if key not in cache:
+            cache[key] = encode(inputs)
+        return cache[key]
+    
+    conditioner.forward = cached_forward
+
 def load_model():
     global model
     if model is None:
@@ -45,9 +99,27 @@ def load_model():
         
         print(f"Loading model on {{device}}...")
         model = MusicGen.get_pretrained("facebook/musicgen-small")
+        cache_text_conditioning(model)
+        
+        # GPU optimization: BF16 where supported (wider range than FP16, same speed), else FP16
+        if device == 'cuda':
+            dtype = torch.bfloat16 if torch.cuda.is_bf16_supported() else torch.float16
+            model = model.to(dtype=dtype, device=device)
+            print(f"Model optimized for GPU with {{dtype}}")
+        
+        if {QUANTIZE_LM_INT8}:
+            quantize_lm(model, device)
         
         if device == 'cuda':
-            model = model.to(dtype=torch.float16, device=device)
+            # Compile the LM step (CUDA graphs) to cut per-token dispatch overhead (PyTorch >= 2.1)
+            if hasattr(torch, "compile"):
+                model.lm.forward = torch.compile(model.lm.forward, mode="reduce-overhead", fullgraph=False)
+                
+                # Warm-up so compilation happens before the first real chunk
+                print(f"Compiling LM forward (warm-up generation)...")
+                model.set_generation_params(duration=1)
+                with torch.no_grad():
+                    model.generate(["warmup"], progress=False)
         
         model.set_generation_params(
             use_sampling=True,
@@ -59,52 +131,154 @@ def load_model():
         )
     return model
 
-def generate_chunk(prompt, duration, output_path):
-    model = load_model()
-    model.set_generation_params(duration=duration)
-    
-    with torch.no_grad():
-        wav = model.generate([prompt], progress=True)
-    
+# Loudness normalization + WAV encoding run on CPU threads while the GPU starts the
+# next batch; "flush" requests wait for them
+write_pool = ThreadPoolExecutor(max_workers=4)
+pending_writes = []
+
+def write_chunk(wav, sample_rate, output_path):
     audio_write(
         output_path.replace('.wav', ''), 
-        wav[0].cpu(), 
-        model.sample_rate, 
+        wav, 
+        sample_rate, 
         strategy="loudness", 
         loudness_compressor=True
     )
+
+def flush_writes():
+    """Wait for queued writes; returns the errors of any that failed"""
+    global pending_writes
+    futures, pending_writes = pending_writes, []
+    return [str(future.exception()) for future in futures if future.exception()]
+
+def generate_batch(prompts, duration, output_paths):
+    model = load_model()
+    model.set_generation_params(duration=duration)
+    
+    # One forward pass for the whole batch; fall back to one prompt at a time on OOM
+    try:
+        with torch.no_grad():
+            wavs = list(model.generate(prompts, progress=False))
+    except torch.cuda.OutOfMemoryError:
+        print(f"Out of GPU memory at batch size {{len(prompts)}}, falling back to 1")
+        torch.cuda.empty_cache()
+        wavs = []
+        for prompt in prompts:
+            with torch.no_grad():
+                wavs.append(model.generate([prompt], progress=False)[0])
+    
+    for wav, output_path in zip(wavs, output_paths):
+        pending_writes.append(write_pool.submit(write_chunk, wav.cpu(), model.sample_rate, output_path))
     
-    return output_path
+    return output_paths
 
 if __name__ == "__main__":
-    prompt = sys.argv[1]
-    duration = int(sys.argv[2])
-    output_path = sys.argv[3]
-    generate_chunk(prompt, duration, output_path)
+    # Persistent worker: one JSON request per stdin line, one JSON reply per stdout line.
+    # Everything else printed by us or AudioCraft goes to stderr so replies stay parseable.
+    replies = sys.stdout
+    sys.stdout = sys.stderr
+    
+    load_model()
+    replies.write(json.dumps({{"ready": True}}) + "\\n")
+    replies.flush()
+    
+    for line in sys.stdin:
+        request = json.loads(line)
+        try:
+            if request.get("flush"):
+                errors = flush_writes()
+                reply = {{"ok": not errors, "error": "; ".join(errors)}}
+            else:
+                generate_batch(request["prompts"], request["duration"], request["output_paths"])
+                reply = {{"ok": True}}
+        except Exception as e:
+            reply = {{"ok": False, "error": str(e)}}
+        replies.write(json.dumps(reply) + "\\n")
+        replies.flush()
+    
+    flush_writes()
 '''
         
         script_path = "/tmp/audiocraft_generator.py"
+        
+        # The script only changes with the code/config, so skip the rewrite when it matches
+        try:
+            with open(script_path, 'r') as f:
+                if f.read() == script_content:
+                    return script_path
+        except FileNotFoundError:
+            pass
+        
         with open(script_path, 'w') as f:
             f.write(script_content)
         return script_path
     
+    def _ensure_worker(self) -> bool:
+        """Start (or restart) the persistent AudioCraft worker; the model loads once per worker"""
+        if self.worker and self.worker.poll() is None:
+            return True
+        
+        if self.worker:
+            print(f"Worker exited with code {self.worker.returncode}, restarting...")
+        
+        self.worker = subprocess.Popen(
+            [AUDIOCRAFT_VENV, self.generation_script],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            text=True,
+            bufsize=1,
+            cwd="/root/home_projects/audiocraft"
+        )
+        
+        # Worker replies once the model is loaded
+        if not self.worker.stdout.readline():
+            print("✗ Worker failed to start")
+            self.worker = None
+            return False
+        return True
+    
+    def stop_worker(self):
+        """Stop the persistent worker"""
+        if self.worker and self.worker.poll() is None:
+            self.worker.stdin.close()
+            self.worker.wait()
+        self.worker = None
+    
     def generate_chunk(self, prompt: str, output_path: str, duration: int = 30) -> bool:
         """Generate single audio chunk"""
+        return self.generate_batch([prompt], [output_path], duration)
+    
+    def generate_batch(self, prompts: List[str], output_paths: List[str], duration: int = 30) -> bool:
+        """Generate several audio chunks in one worker request (one MusicGen forward pass)"""
+        return self._request({"prompts": prompts, "duration": duration, "output_paths": output_paths})
+    
+    def wait_for_writes(self) -> bool:
+        """Block until the worker has written every chunk generated so far"""
+        if not (self.worker and self.worker.poll() is None):
+            return True
+        return self._request({"flush": True})
+    
+    def _request(self, request: Dict) -> bool:
+        """Send one request to the worker and wait for its reply"""
         try:
-            cmd = [
-                AUDIOCRAFT_VENV,
-                self.generation_script,
-                prompt,
-                str(duration),
-                output_path
-            ]
+            if not self._ensure_worker():
+                return False
+            
+            self.worker.stdin.write(json.dumps(request) + "\n")
+            self.worker.stdin.flush()
             
-            result = subprocess.run(cmd, text=True, cwd="/root/home_projects/audiocraft")
-            return result.returncode == 0
+            reply_line = self.worker.stdout.readline()
+            if not reply_line:
+                print("✗ Worker died during generation")
+                return False
+            
+            reply = json.loads(reply_line)
+            if not reply["ok"]:
+                print(f"Generation error: {reply['error']}")
+            return reply["ok"]
         except Exception as e:
             print(f"Generation error: {e}")
             return False
-from config import PROMPTS
 
 class ScheduledGenerator:
     def __init__(self):
@@ -112,6 +286,10 @@ class ScheduledGenerator:
         self.generator = AudioGenerator()
         self.chunks_per_week = 240  # 2 hours = 240 × 30s chunks
         self.chunks_per_session = 24  # Generate 24 chunks per session (12 minutes of audio)
+        
+        # Prompt rotation is the same every session; build the per-chunk prompts once
+        self.session_prompt_indices = [i % len(PROMPTS) for i in range(self.chunks_per_session)]
+        self.session_prompts = [PROMPTS[i] for i in self.session_prompt_indices]
     
     def generate_weekly_batch(self, week_id: str = None) -> bool:
         """Generate full week's content (240 chunks)"""
@@ -124,16 +302,20 @@ class ScheduledGenerator:
         generated_files = []
         sessions_needed = self.chunks_per_week // self.chunks_per_session  # 10 sessions
         
-        for session in range(sessions_needed):
-            print(f"\n--- Session {session + 1}/{sessions_needed} ---")
-            session_files = self.generate_session_batch()
-            
-            if session_files:
-                generated_files.extend(session_files)
-                print(f"✓ Session complete: {len(session_files)} chunks")
-            else:
-                print(f"✗ Session failed")
-                return False
+        # The AudioCraft worker stays warm across all sessions of the week
+        try:
+            for session in range(sessions_needed):
+                print(f"\n--- Session {session + 1}/{sessions_needed} ---")
+                session_files = self.generate_session_batch()
+                
+                if session_files:
+                    generated_files.extend(session_files)
+                    print(f"✓ Session complete: {len(session_files)} chunks")
+                else:
+                    print(f"✗ Session failed")
+                    return False
+        finally:
+            self.generator.stop_worker()
         
         # Add to library
         if generated_files:
@@ -149,22 +331,28 @@ class ScheduledGenerator:
         temp_dir = tempfile.mkdtemp(prefix="weekly_gen_")
         
         try:
-            for i in range(self.chunks_per_session):
+            for batch_start in range(0, self.chunks_per_session, GENERATION_BATCH_SIZE):
+                batch = range(batch_start, min(batch_start + GENERATION_BATCH_SIZE, self.chunks_per_session))
+                
                 # Rotate through prompts
-                prompt_index = i % len(PROMPTS)
-                prompt = PROMPTS[prompt_index]
+                prompts = self.session_prompts[batch.start:batch.stop]
                 
-                # Generate 30-second chunk
-                temp_path = os.path.join(temp_dir, f"chunk_{i:03d}_30s.wav")
+                # Generate 30-second chunks
+                temp_paths = [os.path.join(temp_dir, f"chunk_{i:03d}_30s.wav") for i in batch]
                 
-                print(f"  Generating chunk {i+1}/24: prompt {prompt_index}")
+                print(f"  Generating chunks {batch[0]+1}-{batch[-1]+1}/24: prompts {self.session_prompt_indices[batch.start:batch.stop]}")
                 
-                if self.generator.generate_chunk(prompt, temp_path, duration=30):
-                    session_files.append(temp_path)
+                if self.generator.generate_batch(prompts, temp_paths, duration=30):
+                    session_files.extend(temp_paths)
                 else:
-                    print(f"  ✗ Failed to generate chunk {i+1}")
+                    print(f"  ✗ Failed to generate chunks {batch[0]+1}-{batch[-1]+1}")
                     break
             
+            # Files are written in the background by the worker (and are lost if it died)
+            if not self.generator.wait_for_writes() or not all(os.path.exists(f) for f in session_files):
+                print(f"  ✗ Failed to write session chunks")
+                return []
+            
             return session_files
             
         except Exception as e:
@@ -179,7 +367,10 @@ class ScheduledGenerator:
         print(f"Week: {week_id}")
         print(f"Generating {self.chunks_per_session} chunks...")
         
-        session_files = self.generate_session_batch()
+        try:
+            session_files = self.generate_session_batch()
+        finally:
+            self.generator.stop_worker()
         
         if session_files:
             # Add to library with session timestamp
@@ -198,12 +389,7 @@ class ScheduledGenerator:
             week_id = datetime.now().strftime("%Y_W%U")
         
         # Count chunks for this week
-        week_chunks = [
-            chunk for chunk in self.library.metadata["weekly_additions"]["chunks"]
-            if chunk["week_added"].startswith(week_id)
-        ]
-        
-        progress = len(week_chunks)
+        progress = self.library.get_week_chunk_count(week_id)
         remaining = max(0, self.chunks_per_week - progress)
         
         return {
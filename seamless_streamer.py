@@ -7,8 +7,68 @@ Creates ultra-smooth transitions between 30-second chunks
 import subprocess
 import random
 import tempfile
+import hashlib
 import os
+import wave
+import mmap
+import struct
+import threading
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterator, List, Optional, Tuple
 from content_library import ContentLibrary
+from ffmpeg_runner import run_ffmpeg
+
+# Rendered lofi chunks and crossfade transitions, reused across streams
+XFADE_CACHE_DIR = "/tmp/xfade_cache"
+# Least recently used pieces are evicted once the cache grows past this
+XFADE_CACHE_MAX_BYTES = 32 * 1024 ** 3
+CROSSFADE_SECONDS = 3
+CROSSFADE_FRAMES = CROSSFADE_SECONDS * 44100
+# Exponential fade curves and the noise level for the transitions, computed once
+FADE_IN = np.exp(np.linspace(-5, 0, CROSSFADE_FRAMES)).astype(np.float32)
+FADE_OUT = FADE_IN[::-1].copy()
+NOISE_AMPLITUDE = 0.02
+LOFI_FILTER = "lowpass=f=8000,aecho=0.6:0.3:1000:0.2"
+COMPRESSOR_FILTER = "acompressor=threshold=0.1:ratio=2:attack=200:release=1000"
+# Every cached piece shares one format so the concat demuxer can join them with -c copy
+OUTPUT_FORMAT = "aformat=sample_fmts=s16:sample_rates=44100:channel_layouts=stereo"
+
+# The video loop pre-encoded once at the stream's exact settings, streamed with -c:v copy
+PREPARED_LOOP = "/tmp/loop_prepped.ts"
+
+# Video encoders in order of preference: hardware first, libx264 as the fallback.
+# Each entry is (global args before the inputs, video encoding args).
+VIDEO_ENCODERS = {
+    "h264_nvenc": ([], [
+        '-c:v', 'h264_nvenc', '-preset', 'p4', '-tune', 'll', '-zerolatency', '1',
+        '-rc', 'cbr', '-b:v', '6000k', '-maxrate', '6800k', '-bufsize', '6800k',
+        '-vf', 'scale=1920:1080,fps=24', '-g', '48', '-bf', '0'
+    ]),
+    "h264_qsv": ([], [
+        '-c:v', 'h264_qsv', '-preset', 'veryfast', '-look_ahead', '0',
+        '-b:v', '6000k', '-maxrate', '6800k', '-bufsize', '13600k',
+        '-vf', 'scale=1920:1080,fps=24', '-g', '48', '-bf', '0'
+    ]),
+    "h264_vaapi": (['-vaapi_device', '/dev/dri/renderD128'], [
+        '-c:v', 'h264_vaapi', '-rc_mode', 'CBR',
+        '-b:v', '6000k', '-maxrate', '6800k', '-bufsize', '13600k',
+        '-vf', 'fps=24,format=nv12,hwupload,scale_vaapi=w=1920:h=1080', '-g', '48', '-bf', '0'
+    ]),
+    "libx264": ([], [
+        '-c:v', 'libx264',      # Video codec
+        '-preset', 'superfast', # Encoding speed
+        '-tune', 'zerolatency', # Low latency for live
+        # CBR HRD, fixed 2s GOP, one reference frame (zerolatency already drops lookahead and B-frames)
+        '-x264-params', 'nal-hrd=cbr:scenecut=0:keyint=48:min-keyint=48:ref=1',
+        '-b:v', '6000k',        # Video bitrate
+        '-maxrate', '6000k',    # Equal to the bitrate, or nal-hrd=cbr falls back to VBR
+        '-bufsize', '12000k',   # Buffer size (2x maxrate)
+        '-vf', 'scale=1920:1080,fps=24', # Scale + consistent fps
+        '-g', '48',             # 2-second keyframes (24fps * 2)
+        '-keyint_min', '48',    # Min keyframe interval
+    ]),
+}
 
 class SeamlessStreamer:
     def __init__(self, stream_key: str, video_loop: str):
@@ -17,8 +77,101 @@ class SeamlessStreamer:
         self.library = ContentLibrary()
         self.rtmp_url = f"rtmp://a.rtmp.youtube.com/live2/{stream_key}"
     
-    def create_seamless_audio_stream(self, duration_hours: int = 24) -> str:
-        """Create seamless audio with crossfades between chunks"""
+    def _cache_path(self, *paths: str) -> str:
+        """Cache file for a rendered piece, keyed by the source chunks' paths, sizes and mtimes"""
+        h = hashlib.blake2b(digest_size=8)
+        for path in paths:
+            # A chunk regenerated in place gets a new key instead of a stale render
+            st = os.stat(path)
+            h.update(f"{path}\0{st.st_size}\0{st.st_mtime_ns}\0".encode())
+        return os.path.join(XFADE_CACHE_DIR, f"{h.hexdigest()}.wav")
+    
+    def _cache_hit(self, path: str) -> bool:
+        """Whether a piece is already cached; a hit refreshes its mtime for LRU eviction"""
+        try:
+            os.utime(path)
+            return True
+        except FileNotFoundError:
+            return False
+    
+    def _evict_cache(self, keep: set):
+        """Delete least recently used pieces (never those in keep) until the cache fits its budget"""
+        with os.scandir(XFADE_CACHE_DIR) as it:
+            entries = [(entry.stat().st_mtime, entry.stat().st_size, entry.path) for entry in it if entry.is_file()]
+        total = sum(size for _, size, _ in entries)
+        
+        for _, size, path in sorted(entries):
+            if total <= XFADE_CACHE_MAX_BYTES:
+                break
+            if path in keep:
+                continue
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+    
+    def _render(self, cmd: List[str], output_path: str) -> str:
+        """Run an ffmpeg render into the cache, publishing the file only once complete"""
+        part_path = output_path + ".part.wav"
+        returncode, log_tail = run_ffmpeg(['ffmpeg', '-y', '-v', 'error'] + cmd + [part_path])
+        if returncode != 0:
+            raise RuntimeError(log_tail)
+        os.replace(part_path, output_path)
+        return output_path
+    
+    def _preprocess_chunk(self, chunk_path: str) -> str:
+        """Render a chunk through the lofi effects chain once; cached across streams"""
+        output_path = self._cache_path(chunk_path)
+        if self._cache_hit(output_path):
+            return output_path
+        return self._render([
+            '-i', chunk_path,
+            '-af', f"{LOFI_FILTER},{COMPRESSOR_FILTER},{OUTPUT_FORMAT}",
+            '-c:a', 'pcm_s16le'
+        ], output_path)
+    
+    def _body_outpoint(self, cached_path: str) -> float:
+        """Time where the last CROSSFADE_FRAMES of a rendered chunk (the transition's tail) begin"""
+        with wave.open(cached_path, 'rb') as wav:
+            return max(wav.getnframes() - CROSSFADE_FRAMES, 0) / wav.getframerate()
+    
+    def _render_transition(self, a_path: str, b_path: str) -> str:
+        """Render the 3s crossfade (with ambient noise) from the end of chunk A into chunk B; cached"""
+        output_path = self._cache_path(a_path, b_path)
+        if self._cache_hit(output_path):
+            return output_path
+        
+        # Crossfade the already-processed chunks so effects are not applied again here
+        with wave.open(self._cache_path(a_path), 'rb') as wav:
+            params = wav.getparams()
+            wav.setpos(max(wav.getnframes() - CROSSFADE_FRAMES, 0))
+            tail_a = np.frombuffer(wav.readframes(CROSSFADE_FRAMES), dtype=np.int16)
+        with wave.open(self._cache_path(b_path), 'rb') as wav:
+            head_b = np.frombuffer(wav.readframes(CROSSFADE_FRAMES), dtype=np.int16)
+        
+        tail_a = tail_a.reshape(-1, params.nchannels)
+        head_b = head_b.reshape(-1, params.nchannels)
+        if len(tail_a) < CROSSFADE_FRAMES or len(head_b) < CROSSFADE_FRAMES:
+            raise RuntimeError(f"chunk shorter than the {CROSSFADE_SECONDS}s crossfade: {a_path} -> {b_path}")
+        
+        # Brown noise bed: integrated white noise, centred, peaking at NOISE_AMPLITUDE
+        brown = np.cumsum(np.random.default_rng().standard_normal(CROSSFADE_FRAMES, dtype=np.float32))
+        brown -= brown.mean()
+        brown *= NOISE_AMPLITUDE * 32767 / np.abs(brown).max()
+        
+        crossfade = tail_a * FADE_OUT[:, None] + head_b * FADE_IN[:, None]
+        mixed = crossfade * 0.95 + brown[:, None] * 0.05
+        
+        part_path = output_path + ".part.wav"
+        with wave.open(part_path, 'wb') as out:
+            out.setparams(params)
+            out.writeframes(mixed.clip(-32768, 32767).astype(np.int16).tobytes())
+        os.replace(part_path, output_path)
+        return output_path
+    
+    def _prepare_stream_pieces(self, duration_hours: int) -> List[Tuple[str, float, Optional[float]]]:
+        """Pick chunks, render any uncached pieces, and return the stream as (path, inpoint, outpoint) pieces"""
         chunks_needed = duration_hours * 60 * 2  # 2 chunks per minute
         all_chunks = self.library.get_all_chunks()
         
@@ -27,73 +180,223 @@ class SeamlessStreamer:
         
         selected_chunks = random.sample(all_chunks, chunks_needed)
         
-        # Create simple concatenation (crossfade is complex, let's start simple)
-        inputs = []
+        # Render only what is not cached yet: each chunk through the lofi chain once,
+        # then each (A, B) crossfade once; both are reused by later streams
+        os.makedirs(XFADE_CACHE_DIR, exist_ok=True)
+        chunk_paths = [chunk['path'] for chunk in selected_chunks]
+        transitions = list(zip(chunk_paths, chunk_paths[1:]))
         
-        for chunk in selected_chunks:
-            inputs.extend(['-i', chunk['path']])
+        print("Rendering lofi chunks and crossfades...")
+        with ThreadPoolExecutor(max_workers=os.cpu_count()) as pool:
+            list(pool.map(self._preprocess_chunk, set(chunk_paths)))
+            list(pool.map(lambda pair: self._render_transition(*pair), set(transitions)))
         
-        # Create ultra-smooth lofi transitions with ambient elements
-        if len(selected_chunks) == 1:
-            filter_complex = "[0:a]lowpass=f=8000,aecho=0.6:0.3:1000:0.2,aformat=sample_rates=44100[out]"
-        else:
-            # Build crossfade chain with lofi ambient elements
-            filter_parts = []
-            
-            # Generate vinyl crackle noise for transitions
-            noise_gen = "anoisesrc=duration=3:sample_rate=44100:amplitude=0.02:color=brown"
-            
-            # First chunk with lofi processing
-            current_label = "0processed"
-            filter_parts.append(f"[0:a]lowpass=f=8000,aecho=0.6:0.3:1000:0.2[{current_label}];")
-            
-            # Chain crossfades with ambient noise between chunks
-            for i in range(1, len(selected_chunks)):
-                processed_label = f"{i}processed"
-                crossfade_label = f"cf{i}"
-                noise_label = f"noise{i}"
-                
-                # Process current chunk with lofi effects
-                filter_parts.append(f"[{i}:a]lowpass=f=8000,aecho=0.6:0.3:1000:0.2[{processed_label}];")
-                
-                # Generate transition noise
-                filter_parts.append(f"{noise_gen}[{noise_label}];")
-                
-                # Crossfade with ambient noise mixed in
-                filter_parts.append(f"[{current_label}][{processed_label}]acrossfade=d=3:c1=exp:c2=exp[temp{i}];")
-                filter_parts.append(f"[temp{i}][{noise_label}]amix=inputs=2:duration=longest:weights=0.95 0.05[{crossfade_label}];")
-                
-                current_label = crossfade_label
-            
-            # Final output with gentle compression
-            filter_complex = ''.join(filter_parts) + f"[{current_label}]acompressor=threshold=0.1:ratio=2:attack=200:release=1000,aformat=sample_rates=44100[out]"
+        # Stream = chunk bodies (with the crossfaded 3s trimmed off each side) alternating
+        # with their cached transitions
+        # with their cached transitions. The body ends where the transition's tail of A begins,
+        # taken from the rendered file: library durations are nominal, not sample-exact
+        outpoints = {path: self._body_outpoint(self._cache_path(path)) for path in set(chunk_paths)}
+        pieces = []
+        for i, chunk in enumerate(selected_chunks):
+            inpoint = CROSSFADE_SECONDS if i > 0 else 0
+            if i < len(selected_chunks) - 1:
+                pieces.append((self._cache_path(chunk['path']), inpoint, outpoints[chunk['path']]))
+                pieces.append((self._cache_path(chunk['path'], selected_chunks[i + 1]['path']), 0, None))
+            else:
+                pieces.append((self._cache_path(chunk['path']), inpoint, None))
+        
+        self._evict_cache({path for path, _, _ in pieces})
+        return pieces
+    
+    def create_seamless_audio_stream(self, duration_hours: int = 24) -> str:
+        """Create seamless audio with crossfades between chunks"""
+        try:
+            pieces = self._prepare_stream_pieces(duration_hours)
+        except RuntimeError as e:
+            print(f"✗ Audio creation failed: {e}")
+            return None
+        
+        # The concat demuxer joins the cached pieces without re-encoding; its list goes over stdin
+        filelist = []
+        for path, inpoint, outpoint in pieces:
+            filelist.append(f"file '{path}'\n")
+            if inpoint:
+                filelist.append(f"inpoint {inpoint}\n")
+            if outpoint is not None:
+                filelist.append(f"outpoint {outpoint}\n")
         
         # Create temporary seamless audio file
         temp_audio = "/tmp/seamless_stream.wav"
         
-        cmd = ['ffmpeg', '-y'] + inputs + [
-            '-filter_complex', filter_complex,
-            '-map', '[out]' if len(selected_chunks) > 1 else '0:a',
-            '-c:a', 'pcm_s16le',
+        cmd = [
+            'ffmpeg', '-y', '-f', 'concat', '-safe', '0',
+            '-protocol_whitelist', 'pipe,file',
+            '-i', 'pipe:0',
+            '-c', 'copy',
             temp_audio
         ]
         
         print("Creating seamless audio stream...")
-        result = subprocess.run(cmd, capture_output=True)
+        returncode, log_tail = run_ffmpeg(cmd, duration_hours * 3600, input_data=''.join(filelist).encode())
         
-        if result.returncode == 0:
+        if returncode == 0:
             print(f"✅ Seamless audio created: {temp_audio}")
             return temp_audio
         else:
-            print(f"✗ Audio creation failed: {result.stderr.decode()}")
+            print(f"✗ Audio creation failed: {log_tail}")
+            return None
+    
+    def _prefetch(self, path: str):
+        """Ask the kernel to start reading a piece into the page cache before we need it"""
+        if not hasattr(os, 'posix_fadvise'):
+            return
+        fd = os.open(path, os.O_RDONLY)
+        try:
+            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_WILLNEED)
+        finally:
+            os.close(fd)
+    
+    def _wav_layout(self, data) -> Tuple[int, int, int, int]:
+        """(data start, data end, sample rate, bytes per frame) of a RIFF/WAVE file"""
+        if data[:4] != b'RIFF' or data[8:12] != b'WAVE':
+            raise ValueError("not a WAV file")
+        
+        rate = frame_size = None
+        pos = 12
+        while pos + 8 <= len(data):
+            chunk_id = data[pos:pos + 4]
+            size = struct.unpack_from('<I', data, pos + 4)[0]
+            if chunk_id == b'fmt ':
+                rate, = struct.unpack_from('<I', data, pos + 12)
+                frame_size, = struct.unpack_from('<H', data, pos + 20)
+            elif chunk_id == b'data' and rate:
+                return pos + 8, min(pos + 8 + size, len(data)), rate, frame_size
+            pos += 8 + size + (size & 1)
+        raise ValueError("no fmt/data chunk")
+    
+    def _piece_range(self, data, inpoint: float, outpoint: Optional[float]) -> Tuple[int, int, int]:
+        """(start, end, bytes per frame) of a piece's PCM between inpoint and outpoint"""
+        data_start, data_end, rate, frame_size = self._wav_layout(data)
+        start = data_start + round(inpoint * rate) * frame_size
+        end = data_end if outpoint is None else min(data_start + round(outpoint * rate) * frame_size, data_end)
+        return start, end, frame_size
+    
+    def iter_pcm_frames(self, pieces: List[Tuple[str, float, Optional[float]]], frame_bytes: int = 65536) -> Iterator[memoryview]:
+        """Yield the stream's raw PCM in order as zero-copy views over each mmapped piece"""
+        for i, (path, inpoint, outpoint) in enumerate(pieces):
+            # Next piece is read ahead by the kernel while this one is being encoded
+            if i + 1 < len(pieces):
+                self._prefetch(pieces[i + 1][0])
+            
+            with open(path, 'rb') as f:
+                mm = mmap.mmap(f.fileno(), 0, prot=mmap.PROT_READ)
+            with mm, memoryview(mm) as view:
+                start, end, frame_size = self._piece_range(mm, inpoint, outpoint)
+                block = frame_bytes - frame_bytes % frame_size
+                
+                for offset in range(start, end, block):
+                    # Released once the consumer asks for the next block, so the mapping can close
+                    with view[offset:min(offset + block, end)] as data:
+                        yield data
+    
+    def _feed_audio(self, process: subprocess.Popen, pieces: List[Tuple[str, float, Optional[float]]]):
+        """Write the stream's PCM into ffmpeg's stdin (runs on its own thread)"""
+        try:
+            if not hasattr(os, 'sendfile'):
+                for data in self.iter_pcm_frames(pieces):
+                    process.stdin.write(data)
+                return
+            
+            # Kernel-to-kernel: file pages go straight into the pipe without a userspace copy
+            out_fd = process.stdin.fileno()
+            for i, (path, inpoint, outpoint) in enumerate(pieces):
+                if i + 1 < len(pieces):
+                    self._prefetch(pieces[i + 1][0])
+                
+                fd = os.open(path, os.O_RDONLY)
+                try:
+                    if hasattr(os, 'posix_fadvise'):
+                        os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_SEQUENTIAL)
+                    # Only the header pages of the mapping are touched
+                    with mmap.mmap(fd, 0, prot=mmap.PROT_READ) as mm:
+                        offset, end, _ = self._piece_range(mm, inpoint, outpoint)
+                    while offset < end:
+                        sent = os.sendfile(out_fd, fd, offset, min(1 << 20, end - offset))
+                        if sent == 0:
+                            break
+                        offset += sent
+                    # Each piece plays once per stream; drop it so it cannot push the video loop out of cache
+                    if hasattr(os, 'posix_fadvise'):
+                        os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+                finally:
+                    os.close(fd)
+        except BrokenPipeError:
+            pass  # ffmpeg exited; the main thread reports it
+        except Exception as e:
+            print(f"✗ Audio feed failed: {e}")
+        finally:
+            try:
+                process.stdin.close()
+            except BrokenPipeError:
+                pass
+    
+    def _detect_hw_encoder(self) -> str:
+        """Pick the first video encoder this ffmpeg build has and can actually open"""
+        result = subprocess.run(['ffmpeg', '-hide_banner', '-encoders'], capture_output=True, text=True)
+        available = result.stdout if result.returncode == 0 else ""
+        
+        for name, (global_args, video_args) in VIDEO_ENCODERS.items():
+            if name == "libx264":
+                break
+            if name not in available:
+                continue
+            
+            # Listed encoders can still lack a device/driver, so encode one test frame
+            try:
+                probe = subprocess.run(
+                    ['ffmpeg', '-v', 'error'] + global_args +
+                    ['-f', 'lavfi', '-i', 'color=size=1920x1080:rate=24', '-frames:v', '1'] +
+                    video_args + ['-f', 'null', '-'],
+                    capture_output=True, timeout=30
+                )
+            except subprocess.TimeoutExpired:
+                continue
+            if probe.returncode == 0:
+                return name
+        return "libx264"
+    
+    def _ensure_prepared_loop(self) -> Optional[str]:
+        """Encode the video loop once to the RTMP settings (1080p24, 6000k, closed 2s GOP); None if that fails"""
+        if os.path.exists(PREPARED_LOOP) and os.path.getmtime(PREPARED_LOOP) >= os.path.getmtime(self.video_loop):
+            return PREPARED_LOOP
+        
+        print("Preparing video loop (one-time encode)...")
+        part_path = PREPARED_LOOP + ".part"
+        cmd = [
+            'ffmpeg', '-y', '-i', self.video_loop,
+            '-c:v', 'libx264', '-preset', 'slow', '-pix_fmt', 'yuv420p',
+            '-x264-params', 'keyint=48:min-keyint=48:scenecut=0:open-gop=0',
+            '-b:v', '6000k', '-maxrate', '6800k', '-bufsize', '13600k',
+            '-r', '24', '-vf', 'scale=1920:1080',
+            '-an', '-f', 'mpegts', part_path
+        ]
+        returncode, log_tail = run_ffmpeg(cmd)
+        if returncode != 0:
+            print(f"✗ Video loop preparation failed, encoding live instead: {log_tail}")
             return None
+        
+        os.replace(part_path, PREPARED_LOOP)
+        print(f"✅ Video loop prepared: {PREPARED_LOOP}")
+        return PREPARED_LOOP
     
     def start_youtube_stream(self, duration_hours: int = 24):
         """Start YouTube live stream with video loop and seamless audio"""
         
-        # Create seamless audio
-        audio_file = self.create_seamless_audio_stream(duration_hours)
-        if not audio_file:
+        # Render any uncached pieces; the audio itself is piped to ffmpeg, never written out whole
+        try:
+            pieces = self._prepare_stream_pieces(duration_hours)
+        except RuntimeError as e:
+            print(f"✗ Audio creation failed: {e}")
             return False
         
         print(f"🚀 Starting YouTube stream...")
@@ -101,42 +404,55 @@ class SeamlessStreamer:
         print(f"Audio: Seamless {duration_hours}h stream")
         print(f"RTMP: {self.rtmp_url}")
         
+        # Stream the pre-encoded loop as-is; only encode live if it could not be prepared
+        video_input = self._ensure_prepared_loop()
+        if video_input:
+            global_args, video_args = [], ['-c:v', 'copy']
+            print(f"Video encoder: copy (prepared loop)")
+        else:
+            video_input = self.video_loop
+            encoder = self._detect_hw_encoder()
+            global_args, video_args = VIDEO_ENCODERS[encoder]
+            print(f"Video encoder: {encoder}")
+        
+        # The loop is re-read for the whole stream; have it loaded before ffmpeg starts
+        self._prefetch(video_input)
+        
         # FFmpeg command for YouTube streaming (fixed buffering)
-        cmd = [
-            'ffmpeg',
+        cmd = ['ffmpeg'] + global_args + [
             '-re',                  # Read at real-time rate
             '-stream_loop', '-1',   # Loop video infinitely
-            '-i', self.video_loop,  # Video input (looped)
+            '-i', video_input,      # Video input (looped)
             '-thread_queue_size', '512',  # Increase buffer
-            '-i', audio_file,       # Our generated music
-            '-map', '0:v',          # Video from MP4
+            '-fflags', 'nobuffer', '-analyzeduration', '0', '-probesize', '32',  # Fully specified raw input, nothing to probe
+            '-f', 's16le', '-ar', '44100', '-ac', '2',  # Raw PCM of the cached pieces
+            '-i', 'pipe:0',         # Our generated music, fed from Python
+            '-map', '0:v',          # Video from the loop
             '-map', '1:a',          # Audio from our music
-            '-c:v', 'libx264',      # Video codec
-            '-preset', 'veryfast',  # Encoding speed
-            '-tune', 'zerolatency', # Low latency for live
-            '-b:v', '6000k',        # Video bitrate (close to 6800k recommended)
-            '-maxrate', '6800k',    # Max bitrate (YouTube recommended)
-            '-bufsize', '13600k',   # Buffer size (2x maxrate)
-            '-vf', 'scale=1920:1080,fps=24', # Scale + consistent fps
-            '-g', '48',             # 2-second keyframes (24fps * 2)
-            '-keyint_min', '48',    # Min keyframe interval
+        ] + video_args + [
             '-c:a', 'aac',          # Audio codec
             '-b:a', '128k',         # Audio bitrate
-            '-ar', '44100',         # Audio sample rate
-            '-async', '1',          # Audio sync
+            '-ar', '44100',         # Audio sample rate (same as the piped PCM, so no resync needed)
             '-f', 'flv',            # Output format
+            '-flvflags', 'no_duration_filesize',  # Live output: no header rewrite at the end
             self.rtmp_url           # YouTube RTMP endpoint
         ]
         
         print("Stream command:", ' '.join(cmd))
         print("\n🔴 LIVE STREAMING - Press Ctrl+C to stop")
         
+        process = None
         try:
-            # Start streaming (don't cleanup until done)
-            process = subprocess.run(cmd)
+            process = subprocess.Popen(cmd, stdin=subprocess.PIPE)
+            feeder = threading.Thread(target=self._feed_audio, args=(process, pieces), daemon=True)
+            feeder.start()
+            process.wait()
             return True
         except KeyboardInterrupt:
             print("\n⏹️  Stream stopped by user")
+            if process:
+                process.terminate()
+                process.wait()
             return True
         except Exception as e:
             print(f"✗ Stream failed: {e}")
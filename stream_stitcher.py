@@ -5,17 +5,22 @@ Creates continuous streams from 30-second chunks with prompt-based breaks
 """
 
 import os
-import subprocess
 import json
+import time
 import random
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from typing import List, Dict
 from content_library import ContentLibrary
+from ffmpeg_runner import run_ffmpeg, drop_from_page_cache
 from config import PROMPTS
 
 class StreamStitcher:
     def __init__(self):
         self.library = ContentLibrary()
         self.stitched_dir = self.library.stitched_dir
+        # Segments are stitched concurrently; library metadata updates go one at a time
+        self._metadata_lock = threading.Lock()
     
     def create_stream_segment(self, duration_hours: int, output_name: str) -> str:
         """Create a continuous stream segment of specified duration"""
@@ -25,31 +30,30 @@ class StreamStitcher:
         if len(all_chunks) < chunks_needed:
             raise ValueError(f"Not enough chunks: need {chunks_needed}, have {len(all_chunks)}")
         
-        # Shuffle for variety
-        selected_chunks = random.sample(all_chunks, chunks_needed)
-        selected_chunks.sort(key=lambda x: x['id'])  # Maintain some order
+        # Shuffle for variety; get_all_chunks is in id order, so sorting the sampled
+        # positions (plain ints, no key function) keeps the chunks in id order
+        positions = sorted(random.sample(range(len(all_chunks)), chunks_needed))
+        selected_chunks = [all_chunks[i] for i in positions]
         
-        # Create file list for ffmpeg
-        filelist_path = f"/tmp/stream_filelist_{output_name}.txt"
+        # File list for ffmpeg, handed over on its stdin in one write
+        filelist = ''.join(f"file '{chunk['path']}'\n" for chunk in selected_chunks).encode()
         output_path = os.path.join(self.stitched_dir, f"{output_name}_{duration_hours}h.wav")
         
-        with open(filelist_path, 'w') as f:
-            for chunk in selected_chunks:
-                f.write(f"file '{chunk['path']}'\n")
-        
         # Stitch with ffmpeg
         cmd = [
             'ffmpeg', '-f', 'concat', '-safe', '0',
-            '-i', filelist_path,
+            '-protocol_whitelist', 'pipe,file',
+            '-i', 'pipe:0',
             '-c', 'copy',
             '-y', output_path
         ]
         
         print(f"Stitching {chunks_needed} chunks into {duration_hours}h stream...")
-        result = subprocess.run(cmd, capture_output=True, text=True)
+        returncode, log_tail = run_ffmpeg(cmd, duration_hours * 3600, input_data=filelist)
         
-        if result.returncode == 0:
-            os.remove(filelist_path)
+        if returncode == 0:
+            # Written once and not read back here, so keep it from crowding the library out of the page cache
+            drop_from_page_cache(output_path)
             print(f"✓ Created: {output_path}")
             
             # Update metadata
@@ -62,12 +66,12 @@ class StreamStitcher:
                 "chunks_used": [c['id'] for c in selected_chunks]
             }
             
-            self.library.metadata["stitched_streams"]["playlists"].append(stream_info)
-            self.library.save_metadata()
+            with self._metadata_lock:
+                self.library.add_stitched_stream(stream_info)
             
             return output_path
         else:
-            print(f"✗ Stitching failed: {result.stderr}")
+            print(f"✗ Stitching failed: {log_tail}")
             return None
     
     def create_weekly_batch(self) -> List[str]:
@@ -82,13 +86,17 @@ class StreamStitcher:
             {"hours": 4, "name": "night_stream"}
         ]
         
-        for config in configs:
-            segment_path = self.create_stream_segment(
-                config["hours"], 
-                f"{config['name']}_week_{int(time.time())}"
-            )
-            if segment_path:
-                segments.append(segment_path)
+        # Each segment is an I/O-bound ffmpeg concat, so run them side by side
+        week_ts = int(time.time())
+        with ThreadPoolExecutor(max_workers=len(configs)) as pool:
+            futures = [
+                pool.submit(self.create_stream_segment, config["hours"], f"{config['name']}_week_{week_ts}")
+                for config in configs
+            ]
+            for future in futures:
+                segment_path = future.result()
+                if segment_path:
+                    segments.append(segment_path)
         
         return segments
     
@@ -97,7 +105,6 @@ class StreamStitcher:
         return self.create_stream_segment(duration_hours, f"youtube_content_{int(time.time())}")
 
 if __name__ == "__main__":
-    import time
     stitcher = StreamStitcher()
     
     # Test with available content